@@ -0,0 +1,316 @@
+import base64
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from collections import deque
+
+import cv2
+
+log = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = 96
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS access_events (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    camera INTEGER NOT NULL,
+    source TEXT,
+    granted INTEGER NOT NULL,
+    user TEXT,
+    score REAL,
+    faces INTEGER NOT NULL,
+    thumbnail BLOB
+);
+CREATE INDEX IF NOT EXISTS access_events_timestamp ON access_events (timestamp);
+"""
+
+
+def face_crop(face):
+    # (frame, box) -> copy of just the face, so queued events do not keep
+    # whole frames alive
+    if face is None:
+        return None
+    frame, (x, y, w, h) = face
+    crop = frame[max(0, y):y + h, max(0, x):x + w]
+    return crop.copy() if crop.size else None
+
+
+def encode_thumbnail(crop, size=THUMBNAIL_SIZE, quality=80):
+    # Small JPEG of a face crop, or None
+    if crop is None:
+        return None
+    scale = size / max(crop.shape[:2])
+    if scale < 1:
+        crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    ok, data = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return data.tobytes() if ok else None
+
+
+class SqliteAuditStore:
+    # One row per decision; WAL mode so queries never block the writer
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+
+    def open(self):
+        # Called on the writer thread, which owns the connection
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(access_events)")]
+        if "source" not in columns:
+            # Logs written before the camera source was recorded
+            self._conn.execute("ALTER TABLE access_events ADD COLUMN source TEXT")
+
+    def write(self, records):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO access_events "
+                "(timestamp, camera, source, granted, user, score, faces, thumbnail) "
+                "VALUES (:timestamp, :camera, :source, :granted, :user, :score, :faces, "
+                ":thumbnail)",
+                records
+            )
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def query(self, since=None, until=None, camera=None, source=None, user=None,
+              granted=None, limit=100, thumbnails=False):
+        # Newest first; runs on the caller's thread with its own connection
+        if source is not None:
+            source = str(source)  # stored as text, whatever the camera source type
+        clauses, params = [], []
+        for column, op, value in (("timestamp", ">=", since), ("timestamp", "<", until),
+                                  ("camera", "=", camera), ("source", "=", source),
+                                  ("user", "=", user)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        if granted is not None:
+            clauses.append("granted = ?")
+            params.append(int(granted))
+        columns = "timestamp, camera, source, granted, user, score, faces"
+        if thumbnails:
+            columns += ", thumbnail"
+        sql = f"SELECT {columns} FROM access_events"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY timestamp DESC LIMIT ?"
+        params.append(limit)
+
+        if not os.path.exists(self.path):
+            return []
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.row_factory = sqlite3.Row
+            try:
+                rows = conn.execute(sql, params).fetchall()
+            except sqlite3.OperationalError as exc:
+                # A log from before sources were recorded that the writer
+                # thread has not migrated yet
+                if "no such column: source" not in str(exc) or source is not None:
+                    raise
+                sql = sql.replace("source,", "NULL AS source,", 1)
+                rows = conn.execute(sql, params).fetchall()
+        except sqlite3.OperationalError as exc:
+            # The writer thread has not created the table yet
+            if "no such table" not in str(exc):
+                raise
+            rows = []
+        finally:
+            conn.close()
+        records = [dict(row) for row in rows]
+        for record in records:
+            record["granted"] = bool(record["granted"])
+        return records
+
+
+class JsonLinesAuditStore:
+    # Appends one JSON object per decision and rotates at max_bytes,
+    # keeping `backups` old files (audit.jsonl.1 is the most recent)
+
+    def __init__(self, path, max_bytes=10 * 2**20, backups=5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file = None
+
+    def open(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def write(self, records):
+        lines = []
+        for record in records:
+            record = dict(record)
+            if record["thumbnail"] is not None:
+                record["thumbnail"] = base64.b64encode(record["thumbnail"]).decode("ascii")
+            record["granted"] = bool(record["granted"])
+            lines.append(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.write("".join(lines))
+        self._file.flush()
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def query(self, since=None, until=None, camera=None, source=None, user=None,
+              granted=None, limit=100, thumbnails=False):
+        # Scans the current and rotated files, newest first
+        if source is not None:
+            source = str(source)
+        found = []
+        paths = [self.path] + [f"{self.path}.{n}" for n in range(1, self.backups + 1)]
+        for path in paths:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    lines = f.readlines()
+            except OSError:
+                continue
+            for line in reversed(lines):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if ((since is not None and record["timestamp"] < since)
+                        or (until is not None and record["timestamp"] >= until)
+                        or (camera is not None and record["camera"] != camera)
+                        or (source is not None and record.get("source") != source)
+                        or (user is not None and record["user"] != user)
+                        or (granted is not None and record["granted"] != granted)):
+                    continue
+                if thumbnails:
+                    if record["thumbnail"] is not None:
+                        record["thumbnail"] = base64.b64decode(record["thumbnail"])
+                else:
+                    record.pop("thumbnail", None)
+                found.append(record)
+                if len(found) >= limit:
+                    return found
+        return found
+
+    def _rotate(self):
+        self._file.close()
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{n}"):
+                os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+        os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "a", encoding="utf-8")
+
+
+class AuditLog:
+    # Persists every access decision without ever blocking the caller.
+    # record() (an event bus subscriber) only appends to an in-memory ring
+    # buffer and a bounded queue. A writer thread encodes the face
+    # thumbnails and writes everything queued so far (up to batch_size) in
+    # one transaction. If the disk falls behind by more than max_pending
+    # events the newest are dropped and counted, never waited on.
+    #
+    # A path ending in .jsonl selects rotating JSON lines, anything else a
+    # SQLite database.
+
+    def __init__(self, path, thumbnails=True, ring_size=500, max_pending=1000,
+                 batch_size=256):
+        if path.endswith(".jsonl"):
+            self.store = JsonLinesAuditStore(path)
+        else:
+            self.store = SqliteAuditStore(path)
+        self.thumbnails = thumbnails
+        self.batch_size = batch_size
+        self.written = 0
+        self.dropped = 0
+
+        self._ring = deque(maxlen=ring_size)
+        self._queue = queue.Queue(max_pending)
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # Flushes everything queued before returning
+        if self._thread is not None:
+            try:
+                self._queue.put(None, timeout=1)
+            except queue.Full:
+                pass
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def record(self, event):
+        record = {
+            "timestamp": round(event.timestamp, 3),
+            "camera": event.camera_id,
+            "source": None if event.source is None else str(event.source),
+            "granted": event.granted,
+            "user": event.user_name,
+            "score": None if event.score is None else round(event.score, 4),
+            "faces": event.face_count,
+        }
+        self._ring.append(record)
+        try:
+            self._queue.put_nowait(
+                (record, face_crop(event.face) if self.thumbnails else None)
+            )
+        except queue.Full:
+            self.dropped += 1
+
+    def recent(self, limit=50):
+        # Newest first, straight from memory (includes unwritten events)
+        return list(self._ring)[::-1][:limit]
+
+    def query(self, **filters):
+        # since, until, camera, source, user, granted, limit, thumbnails; see the store
+        return self.store.query(**filters)
+
+    def _run(self):
+        try:
+            self.store.open()
+        except (OSError, sqlite3.Error):
+            log.exception("Cannot open audit log %s", self.store.path)
+            return
+        try:
+            stopping = False
+            while not stopping:
+                item = self._queue.get()
+                batch = []
+                while True:
+                    if item is None:
+                        stopping = True
+                    else:
+                        batch.append(item)
+                    if stopping or len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if batch:
+                    self._write(batch)
+        finally:
+            self.store.close()
+
+    def _write(self, batch):
+        records = []
+        for record, crop in batch:
+            records.append(dict(record, granted=int(record["granted"]),
+                                thumbnail=encode_thumbnail(crop)))
+        try:
+            self.store.write(records)
+            self.written += len(records)
+        except (OSError, sqlite3.Error):
+            log.exception("Audit write failed, %d events lost", len(records))
+            self.dropped += len(records)
@@ -0,0 +1,389 @@
+import argparse
+import csv
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from detection import DetectionSettings
+from engine import FaceEngine
+from recognition import FACE_SIZE, EmbeddingIndex, LBPEmbedder
+from sharding import ShardedSearch
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class FrameSource:
+    # Drop-in stand-in for cv2.VideoCapture(0): replays a video file or a
+    # directory of images. Without fps it returns frames as fast as they are
+    # asked for; with fps it paces reads like a live camera. max_frames ends
+    # the replay early.
+
+    def __init__(self, path, fps=None, loop=False, max_frames=None):
+        self.path = path
+        self.fps = fps
+        self.loop = loop
+        self.max_frames = max_frames
+        self.frames_read = 0
+        self.exhausted = False
+        self._next_time = None
+
+        if os.path.isdir(path):
+            self._files = sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+            self._video = None
+        else:
+            self._files = None
+            self._video = cv2.VideoCapture(path)
+        self._position = 0
+
+    def isOpened(self):
+        if self._files is not None:
+            return bool(self._files)
+        return self._video.isOpened()
+
+    def read(self):
+        if self.max_frames is not None and self.frames_read >= self.max_frames:
+            self.exhausted = True
+            return False, None
+        if self.fps:
+            now = time.perf_counter()
+            if self._next_time is not None and now < self._next_time:
+                time.sleep(self._next_time - now)
+            self._next_time = max(now, self._next_time or now) + 1.0 / self.fps
+
+        ret, frame = self._read_next()
+        if not ret and self.loop and self.frames_read:
+            self._rewind()
+            ret, frame = self._read_next()
+        if not ret:
+            self.exhausted = True
+            return False, None
+        self.frames_read += 1
+        return True, frame
+
+    def release(self):
+        if self._video is not None:
+            self._video.release()
+
+    def _read_next(self):
+        if self._files is None:
+            return self._video.read()
+        while self._position < len(self._files):
+            frame = cv2.imread(self._files[self._position])
+            self._position += 1
+            if frame is not None:
+                return True, frame
+        return False, None
+
+    def _rewind(self):
+        if self._files is None:
+            self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        else:
+            self._position = 0
+
+
+def synthetic_face(rng, size=FACE_SIZE):
+    # Smooth random texture standing in for an aligned, equalised face crop
+    noise = rng.integers(0, 256, (size[1], size[0]), dtype=np.uint8)
+    return cv2.equalizeHist(cv2.GaussianBlur(noise, (0, 0), 3))
+
+
+def perturb(face, rng):
+    # A second "capture" of the same person: small shift, lighting and noise
+    h, w = face.shape
+    dx, dy = rng.uniform(-1, 1, 2)
+    shifted = cv2.warpAffine(
+        face, np.float32([[1, 0, dx], [0, 1, dy]]), (w, h), borderMode=cv2.BORDER_REPLICATE
+    )
+    noisy = shifted.astype(np.float32) * rng.uniform(0.8, 1.2) + rng.normal(0, 3, face.shape)
+    return cv2.equalizeHist(np.clip(noisy, 0, 255).astype(np.uint8))
+
+
+def make_gallery(path, users, seed=0):
+    # user_data-style directory with one synthetic face crop per user
+    rng = np.random.default_rng(seed)
+    for i in range(users):
+        folder = os.path.join(path, f"{i:05d}_user{i:05d}")
+        os.makedirs(folder, exist_ok=True)
+        cv2.imwrite(os.path.join(folder, 'face.jpg'), synthetic_face(rng))
+
+
+def max_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def percentiles_ms(samples):
+    p50, p95, p99 = (float(v) for v in np.percentile(samples, (50, 95, 99)) * 1e3)
+    return {"p50_ms": round(p50, 3), "p95_ms": round(p95, 3), "p99_ms": round(p99, 3)}
+
+
+def bench_recognition(users, queries=500, unknown_fraction=0.2, partitioned=True,
+                      embedder_factory=LBPEmbedder, batch=1, seed=0, search_workers=0):
+    # Embedding + index lookup only, no camera or detector involved. With
+    # search_workers the lookups go through a ShardedSearch pool instead.
+    rng = np.random.default_rng(seed)
+    embedder = embedder_factory()
+
+    faces = [synthetic_face(rng) for _ in range(users)]
+    start = time.perf_counter()
+    vectors = np.stack([embedder.embed(face) for face in faces])
+    enroll_time = time.perf_counter() - start
+
+    index = EmbeddingIndex(partitioned=partitioned)
+    start = time.perf_counter()
+    index.add_many(list(range(users)), vectors)
+    build_time = time.perf_counter() - start
+
+    pool = None
+    if search_workers:
+        pool = ShardedSearch(search_workers, min_rows=0)
+        if pool.start():
+            pool.publish(*index.view())
+        else:
+            pool = None
+
+    expected = []
+    probes = []
+    for _ in range(queries):
+        if rng.random() < unknown_fraction:
+            expected.append(None)
+            probes.append(synthetic_face(rng))
+        else:
+            user = int(rng.integers(users))
+            expected.append(user)
+            probes.append(perturb(faces[user], rng))
+
+    embed_times, search_times, nearest, predicted = [], [], [], []
+    for offset in range(0, queries, batch):
+        chunk = probes[offset:offset + batch]
+        start = time.perf_counter()
+        embeddings = embedder.embed_many(chunk)
+        embed_times.append((time.perf_counter() - start) / len(chunk))
+
+        start = time.perf_counter()
+        found = pool.search(embeddings, *index.view()) if pool is not None else None
+        labels, scores = found if found is not None else index.search(embeddings)
+        search_times.append(time.perf_counter() - start)
+        nearest += labels
+        predicted += [
+            label if score >= embedder.threshold else None
+            for label, score in zip(labels, scores)
+        ]
+
+    if pool is not None:
+        pool.stop()
+
+    known = [(e, p) for e, p in zip(expected, predicted) if e is not None]
+    top1 = [e == n for e, n in zip(expected, nearest) if e is not None]
+    unknown = [p for e, p in zip(expected, predicted) if e is None]
+    total = sum(embed_times) * batch + sum(search_times)
+    return {
+        "benchmark": "recognition",
+        "users": users,
+        "partitioned": partitioned and index.partitions() is not None and pool is None,
+        "search_workers": search_workers if pool is not None else 0,
+        "enroll_per_user_ms": round(enroll_time / users * 1e3, 3),
+        "index_build_s": round(build_time, 3),
+        "index_mb": round(users * vectors.shape[1] * 4 / 2**20, 2),
+        "queries_per_s": round(queries / total, 1),
+        "embed": percentiles_ms(embed_times),
+        "search": percentiles_ms(search_times),
+        "top1_accuracy": round(sum(top1) / max(1, len(top1)), 4),
+        "accuracy": round(sum(e == p for e, p in known) / max(1, len(known)), 4),
+        "false_accept_rate": round(sum(p is not None for p in unknown) / max(1, len(unknown)), 4),
+        "max_rss_mb": round(max_rss_mb(), 1),
+    }
+
+
+def load_labels(path):
+    # CSV with "frame,user"; frame is the 0-based frame index, user empty
+    # for a face that should be rejected
+    labels = {}
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            labels[int(row['frame'])] = row.get('user') or None
+    return labels
+
+
+def bench_pipeline(source, gallery=None, users=100, frames=None, workers=2,
+                   fps=None, labels=None, detection_width=640, adaptive=False):
+    # Full capture -> detect -> recognise path through a headless FaceEngine
+    temp_dir = None
+    if gallery is None:
+        temp_dir = tempfile.mkdtemp(prefix='face-bench-')
+        gallery = temp_dir
+        make_gallery(gallery, users)
+
+    matches = {}
+
+    def on_frame(result):
+        if result.verified:
+            matches[result.seq] = result.match
+
+    try:
+        start = time.perf_counter()
+        engine = FaceEngine(
+            gallery,
+            detection_settings=DetectionSettings(detection_width=detection_width),
+            workers=workers,
+            on_frame=on_frame,
+            profile=True,
+            adaptive=adaptive
+        )
+        load_time = time.perf_counter() - start
+
+        capture = FrameSource(source, fps=fps, max_frames=frames)
+        if not capture.isOpened():
+            raise SystemExit(f"Cannot open {source}")
+        engine.start()
+        start = time.perf_counter()
+        # Offline replays process every frame; paced ones drop like a camera
+        camera_id = engine.open_camera(source, capture=capture, lossless=not fps)
+        pipeline = engine.pipelines[camera_id]
+        scheduler = engine.schedulers.get(camera_id)
+
+        # Wait for the source to run dry (or the frame budget) and the
+        # pipeline to drain; give up if nothing moves for stall_timeout
+        stall_timeout = 30.0
+        progress, last_progress = None, time.monotonic()
+        while True:
+            time.sleep(0.05)
+            stats = pipeline.stats
+            if capture.exhausted and stats.rendered + pipeline.dropped() >= stats.captured:
+                break
+            current = (stats.captured, stats.rendered, pipeline.dropped())
+            if current != progress:
+                progress, last_progress = current, time.monotonic()
+            elif time.monotonic() - last_progress > stall_timeout:
+                print(f"warning: pipeline stalled for {stall_timeout:.0f}s, stopping",
+                      file=sys.stderr)
+                break
+        elapsed = time.perf_counter() - start
+        engine.stop()
+
+        report = {
+            "benchmark": "pipeline",
+            "source": source,
+            "users": len(engine.gallery),
+            "workers": workers,
+            "gallery_load_s": round(load_time, 3),
+            "frames_captured": stats.captured,
+            "frames_processed": stats.processed,
+            "frames_dropped": pipeline.dropped(),
+            "frames_failed": stats.failed,
+            "frames_skipped": scheduler.skipped if scheduler is not None else 0,
+            "processed_per_s": round(stats.processed / elapsed, 2),
+            "frames_with_recognition": len(matches),
+            "stages": {
+                stage: {
+                    "count": count,
+                    "p50_ms": round(float(p50) * 1e3, 3),
+                    "p95_ms": round(float(p95) * 1e3, 3),
+                    "p99_ms": round(float(p99) * 1e3, 3),
+                }
+                for _, stage, count, p50, p95, p99 in engine.profiler.summary()
+            },
+            "max_rss_mb": round(max_rss_mb(), 1),
+        }
+
+        if labels:
+            scored = [(labels[seq], match) for seq, match in matches.items() if seq in labels]
+            report["labelled_frames"] = len(scored)
+            report["accuracy"] = round(
+                sum(expected == match for expected, match in scored) / max(1, len(scored)), 4
+            )
+        return report
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def print_report(report):
+    for key, value in report.items():
+        if isinstance(value, dict):
+            print(f"  {key}:")
+            for sub_key, sub_value in value.items():
+                print(f"    {sub_key}: {sub_value}")
+        else:
+            print(f"  {key}: {value}")
+    print()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Offline benchmarks for the detection/recognition path."
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("recognition", help="embedding + gallery lookup on synthetic faces")
+    rec.add_argument("--users", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    rec.add_argument("--queries", type=int, default=500)
+    rec.add_argument("--batch", type=int, default=1, help="faces per lookup")
+    rec.add_argument("--no-partition", action="store_true",
+                     help="always scan the whole index")
+    rec.add_argument("--search-workers", type=int, default=0,
+                     help="scan through a process pool of this size")
+
+    pipe = sub.add_parser("pipeline", help="replay a video or frame directory through the engine")
+    pipe.add_argument("source", help="video file or directory of frames")
+    pipe.add_argument("--gallery", help="existing user_data directory (default: synthetic)")
+    pipe.add_argument("--users", type=int, nargs="+", default=[100],
+                      help="synthetic gallery sizes when --gallery is not given")
+    pipe.add_argument("--frames", type=int, help="stop after this many frames")
+    pipe.add_argument("--workers", type=int, default=2)
+    pipe.add_argument("--fps", type=float, help="pace the source like a live camera")
+    pipe.add_argument("--labels", help="CSV with frame,user ground truth")
+    pipe.add_argument("--detection-width", type=int, default=640)
+    pipe.add_argument("--adaptive", action="store_true",
+                      help="let the scheduler skip idle frames like the live app")
+
+    parser.add_argument("--json", help="also write all reports to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv if argv is not None else sys.argv[1:])
+    reports = []
+
+    if args.command == "recognition":
+        for users in args.users:
+            report = bench_recognition(
+                users, queries=args.queries, batch=args.batch,
+                partitioned=not args.no_partition, search_workers=args.search_workers
+            )
+            print(f"recognition, {users} users")
+            print_report(report)
+            reports.append(report)
+    else:
+        labels = load_labels(args.labels) if args.labels else None
+        sizes = [None] if args.gallery else args.users
+        for users in sizes:
+            report = bench_pipeline(
+                args.source, gallery=args.gallery, users=users or 0,
+                frames=args.frames, workers=args.workers, fps=args.fps,
+                labels=labels, detection_width=args.detection_width,
+                adaptive=args.adaptive
+            )
+            print(f"pipeline, {report['users']} users")
+            print_report(report)
+            reports.append(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
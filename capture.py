@@ -0,0 +1,148 @@
+import logging
+import os
+import threading
+import time
+
+import cv2
+
+log = logging.getLogger(__name__)
+
+
+class CaptureSettings:
+    # Requested camera mode; the driver may pick the nearest it supports.
+    # None leaves a property at the driver default.
+
+    def __init__(self, width=640, height=480, fps=30, fourcc="MJPG", buffer_size=1):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.fourcc = fourcc
+        self.buffer_size = buffer_size
+
+
+class CameraCapture:
+    # cv2.VideoCapture stand-in for live cameras and streams. A grab thread
+    # reads the device continuously and keeps only the newest frame, so the
+    # driver's buffer never fills with stale frames and read() returns
+    # something at most one frame interval old.
+    #
+    # The device is opened on the grab thread, so constructing one never
+    # blocks. When it fails to open, or delivers nothing for stall_timeout
+    # seconds, it is released and reopened after an exponentially growing
+    # delay (backoff .. max_backoff seconds) until it comes back.
+
+    def __init__(self, source, settings=None, stall_timeout=2.0, backoff=0.5,
+                 max_backoff=10.0):
+        self.source = source
+        self.settings = settings or CaptureSettings()
+        self.stall_timeout = stall_timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.state = "connecting"   # connecting, streaming or reconnecting
+        self.reconnects = 0
+        self.frames = 0
+        self.mode = None            # (width, height, fps) the driver settled on
+
+        self._frame = None
+        self._frame_seq = 0
+        self._read_seq = 0
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self._grab_loop, name=f"grab-{source}", daemon=True
+        )
+        self._thread.start()
+
+    def isOpened(self):
+        return not self._stop_event.is_set()
+
+    def read(self, timeout=0.1):
+        # Newest frame not returned before; (False, None) if none arrives
+        # within timeout
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self._frame_seq > self._read_seq or self._stop_event.is_set(),
+                timeout
+            ) or self._frame_seq == self._read_seq:
+                return False, None
+            self._read_seq = self._frame_seq
+            return True, self._frame
+
+    def release(self):
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+
+    def _open(self):
+        capture = cv2.VideoCapture(self.source)
+        if not capture.isOpened():
+            capture.release()
+            return None
+        settings = self.settings
+        # FOURCC first: many UVC cameras only reach higher modes with MJPG
+        if settings.fourcc:
+            capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*settings.fourcc))
+        if settings.width:
+            capture.set(cv2.CAP_PROP_FRAME_WIDTH, settings.width)
+        if settings.height:
+            capture.set(cv2.CAP_PROP_FRAME_HEIGHT, settings.height)
+        if settings.fps:
+            capture.set(cv2.CAP_PROP_FPS, settings.fps)
+        if settings.buffer_size:
+            capture.set(cv2.CAP_PROP_BUFFERSIZE, settings.buffer_size)
+        self.mode = (
+            int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            capture.get(cv2.CAP_PROP_FPS),
+        )
+        log.info("Camera %s opened at %dx%d, %.1f fps", self.source, *self.mode)
+        return capture
+
+    def _grab_loop(self):
+        capture = None
+        delay = self.backoff
+        last_frame = None
+        while not self._stop_event.is_set():
+            if capture is None:
+                capture = self._open()
+                if capture is None:
+                    log.warning("Camera %s unavailable, retrying in %.1fs", self.source, delay)
+                    if self._stop_event.wait(delay):
+                        break
+                    delay = min(self.max_backoff, delay * 2)
+                    continue
+                delay = self.backoff
+                last_frame = time.monotonic()
+
+            ret, frame = capture.read()
+            now = time.monotonic()
+            if ret:
+                last_frame = now
+                self.frames += 1
+                with self._condition:
+                    self._frame = frame
+                    self._frame_seq += 1
+                    self.state = "streaming"
+                    self._condition.notify_all()
+            elif now - last_frame >= self.stall_timeout:
+                log.warning("Camera %s stalled, reconnecting", self.source)
+                capture.release()
+                capture = None
+                self.state = "reconnecting"
+                self.reconnects += 1
+            else:
+                time.sleep(0.01)
+
+        if capture is not None:
+            capture.release()
+
+
+def open_capture(source, settings=None):
+    # Recorded files are read frame by frame as before; cameras and network
+    # streams get the threaded, self-healing CameraCapture
+    if isinstance(source, str) and os.path.isfile(source):
+        return cv2.VideoCapture(source)
+    return CameraCapture(source, settings)
@@ -0,0 +1,118 @@
+import cv2
+import numpy as np
+
+CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+
+
+class DetectionSettings:
+    # Shared between the GUI and every detector; plain attribute writes, read
+    # at the start of each detect() call. Sizes are in full-resolution pixels,
+    # 0 meaning "no limit".
+
+    def __init__(self, detection_width=640, full_detect_interval=5,
+                 min_face_size=40, max_face_size=0, scale_factor=1.3,
+                 min_neighbors=5, roi_margin=0.5):
+        self.detection_width = detection_width
+        self.full_detect_interval = full_detect_interval
+        self.min_face_size = min_face_size
+        self.max_face_size = max_face_size
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.roi_margin = roi_margin
+
+
+class FaceDetector:
+    # Runs the Haar cascade on a downscaled copy of the frame and maps the
+    # boxes back to full resolution. Full-frame detection only happens every
+    # full_detect_interval frames; in between, only the neighbourhood of the
+    # previous faces is searched. One instance per thread/camera.
+
+    def __init__(self, settings=None, cascade_path=CASCADE_PATH):
+        self.settings = settings or DetectionSettings()
+        self.cascade = cv2.CascadeClassifier(cascade_path)
+        self._tracked = []
+        self._frames_since_full = 0
+
+    def reset(self):
+        self._tracked = []
+        self._frames_since_full = 0
+
+    def detect(self, gray, full=False):
+        settings = self.settings
+        small, scale = self._downscale(gray, settings.detection_width)
+
+        run_full = (
+            full
+            or not self._tracked
+            or self._frames_since_full >= settings.full_detect_interval - 1
+        )
+        if run_full:
+            boxes = self._detect_region(small, scale, (0, 0, small.shape[1], small.shape[0]))
+            self._frames_since_full = 0
+        else:
+            boxes = self._track(small, scale)
+            self._frames_since_full += 1
+
+        self._tracked = boxes
+        if not boxes:
+            return np.empty((0, 4), np.int32)
+        return np.round(np.array(boxes, np.float32) / scale).astype(np.int32)
+
+    def _track(self, small, scale):
+        # Search a window around each face seen last time; faces that left
+        # their window are dropped until the next full-frame pass
+        margin = self.settings.roi_margin
+        height, width = small.shape[:2]
+        found = []
+        for (x, y, w, h) in self._tracked:
+            dx, dy = int(w * margin), int(h * margin)
+            x0, y0 = max(0, x - dx), max(0, y - dy)
+            x1, y1 = min(width, x + w + dx), min(height, y + h + dy)
+            boxes = self._detect_region(
+                small, scale, (x0, y0, x1, y1),
+                size_hint=(int(w * 0.6), int(w * 1.6))
+            )
+            for box in boxes:
+                if not any(_overlaps(box, other) for other in found):
+                    found.append(box)
+        return found
+
+    def _detect_region(self, small, scale, region, size_hint=None):
+        settings = self.settings
+        x0, y0, x1, y1 = region
+
+        min_size = int(settings.min_face_size * scale)
+        max_size = int(settings.max_face_size * scale) if settings.max_face_size else 0
+        if size_hint is not None:
+            min_size = max(min_size, size_hint[0])
+            max_size = min(max_size, size_hint[1]) if max_size else size_hint[1]
+        min_size = max(min_size, 1)
+        if min(x1 - x0, y1 - y0) < min_size:
+            return []
+
+        faces = self.cascade.detectMultiScale(
+            small[y0:y1, x0:x1],
+            settings.scale_factor,
+            settings.min_neighbors,
+            minSize=(min_size, min_size),
+            maxSize=(max_size, max_size) if max_size else (0, 0)
+        )
+        return [(x + x0, y + y0, w, h) for (x, y, w, h) in faces]
+
+    @staticmethod
+    def _downscale(gray, detection_width):
+        width = gray.shape[1]
+        if not detection_width or width <= detection_width:
+            return gray, 1.0
+        scale = detection_width / width
+        small = cv2.resize(
+            gray, (detection_width, int(round(gray.shape[0] * scale))),
+            interpolation=cv2.INTER_AREA
+        )
+        return small, scale
+
+
+def _overlaps(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    return ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah
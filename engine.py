@@ -0,0 +1,434 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import cv2
+
+from audit import AuditLog
+from capture import open_capture
+from detection import DetectionSettings, FaceDetector
+from enrollment import BurstEnrollment
+from events import BannerBoard, EventBus
+from gallery import GalleryStore
+from galleryfile import check_record
+from pipeline import FramePipeline
+from profiling import FrameProfiler
+from recognition import FaceNormalizer, LBPEmbedder, largest_face
+from scheduler import DetectionScheduler
+from tracking import FaceTracker
+
+
+def best_identity(identities):
+    # Reduce per-face (user_name, score) pairs to the one that drives the
+    # access decision: the best recognised face, else the best score seen
+    best_name, best_score = None, None
+    for user_name, score in identities:
+        if best_score is not None and score <= best_score:
+            continue
+        if user_name is not None or best_name is None:
+            best_name, best_score = user_name, score
+    return best_name, best_score
+
+
+class RecognitionEngine:
+    # One recogniser shared by every camera. Workers submit the embeddings of
+    # the faces in their frame; a single thread gathers whatever requests
+    # arrive within max_wait (up to max_batch faces) and answers them all
+    # with one lookup against the gallery index.
+    #
+    # timeout bounds how long a worker waits for its answer. It must cover
+    # the slowest search backend, including a ShardedSearch pool timing out
+    # and the in-process fallback after it.
+
+    def __init__(self, gallery, max_batch=32, max_wait=0.005, timeout=3.0):
+        self.gallery = gallery
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.batches = 0
+        self.queries = 0
+        self.timeouts = 0
+
+        self._requests = queue.Queue()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="recognition", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def identify(self, embeddings):
+        # Blocking call from a camera worker; falls back to a direct lookup
+        # when the engine thread is not running. Raises FutureTimeout when
+        # no answer arrives within self.timeout.
+        if not embeddings:
+            return []
+        if self._thread is None:
+            return self.gallery.identify(embeddings)
+        future = Future()
+        self._requests.put((embeddings, future))
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            self.timeouts += 1
+            raise
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                first = self._requests.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            batch = [first]
+            size = len(first[0])
+            while size < self.max_batch:
+                try:
+                    request = self._requests.get(timeout=self.max_wait)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request[0])
+
+            embeddings = [e for request, _ in batch for e in request]
+            try:
+                results = self.gallery.identify(embeddings)
+            except Exception as exc:
+                for _, future in batch:
+                    future.set_exception(exc)
+                continue
+
+            self.batches += 1
+            self.queries += len(embeddings)
+            start = 0
+            for request, future in batch:
+                future.set_result(results[start:start + len(request)])
+                start += len(request)
+
+
+class AccessEvent:
+    # One access decision for one camera, ready to be serialised. camera_id
+    # is the engine's handle for the pipeline; source is the camera index or
+    # URL behind it, which is what identifies the door across restarts.
+
+    def __init__(self, camera_id, granted, user_name=None, score=None,
+                 face_count=0, timestamp=None, face=None, source=None):
+        self.camera_id = camera_id
+        self.source = source
+        self.granted = granted
+        self.user_name = user_name
+        self.score = score
+        self.face_count = face_count
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.face = face  # (frame, box) for the audit thumbnail; not serialised
+
+    @classmethod
+    def from_dict(cls, record):
+        return cls(record["camera"], record["granted"], record["user"], record["score"],
+                   record["faces"], record["timestamp"], source=record.get("source"))
+
+    @property
+    def kind(self):
+        return "access_granted" if self.granted else "access_denied"
+
+    def to_dict(self):
+        return {
+            "event": self.kind,
+            "timestamp": round(self.timestamp, 3),
+            "camera": self.camera_id,
+            "source": self.source,
+            "user": self.user_name,
+            "score": None if self.score is None else round(self.score, 4),
+            "faces": self.face_count,
+        }
+
+
+class DecisionGate:
+    # Turns the per-frame recognition stream of one camera into discrete
+    # access decisions: a new event when the outcome changes, a repeat only
+    # after repeat_interval, and a fresh start once nobody has been in view
+    # for absence_reset seconds.
+
+    def __init__(self, repeat_interval=5.0, absence_reset=2.0):
+        self.repeat_interval = repeat_interval
+        self.absence_reset = absence_reset
+        self._last_outcome = None
+        self._last_event_time = None
+        self._last_face_time = None
+
+    def update(self, result, now):
+        if not result.verified:
+            if (self._last_face_time is not None
+                    and now - self._last_face_time >= self.absence_reset):
+                self._last_outcome = None
+                self._last_event_time = None
+            return None
+
+        self._last_face_time = now
+        outcome = result.match
+        if (self._last_event_time is not None
+                and outcome == self._last_outcome
+                and now - self._last_event_time < self.repeat_interval):
+            return None
+
+        self._last_outcome = outcome
+        self._last_event_time = now
+        return AccessEvent(
+            result.camera_id, outcome is not None, outcome, result.score,
+            len(result.faces), face=(result.frame, largest_face(result.faces))
+        )
+
+
+class FaceEngine:
+    # Capture, detection, recognition and access decisions without any GUI.
+    # The Qt application and the headless service both drive one of these.
+    #
+    # on_frame(result) receives every finished frame (after render(result)
+    # if a renderer is given) on a pipeline thread. Access decisions go out
+    # through self.events: on_event(event) gets every decision and
+    # door_actuator(event) every granted one, both on the event bus thread
+    # so neither can stall the cameras.
+    #
+    # With adaptive=True every camera gets a DetectionScheduler that skips
+    # the cascade on idle, unchanged frames and under CPU pressure.
+    # search_workers > 0 moves large gallery scans into a process pool.
+    # audit_path persists every decision (SQLite, or JSON lines for .jsonl)
+    # through an AuditLog, available as self.audit for queries.
+    # capture_settings (a CaptureSettings) is the mode requested from
+    # cameras, which are read through a reconnecting latest-frame grabber.
+
+    def __init__(self, user_data_dir='user_data', detection_settings=None,
+                 embedder_factory=LBPEmbedder, workers=2, render=None,
+                 on_frame=None, on_event=None, door_actuator=None, profile=False,
+                 adaptive=True, search_workers=0, audit_path=None,
+                 audit_thumbnails=True, capture_settings=None):
+        self.user_data_dir = user_data_dir
+        self.capture_settings = capture_settings
+        self.detection_settings = detection_settings or DetectionSettings()
+        self.workers = workers
+        self.adaptive = adaptive
+        self.render = render
+        self.on_frame = on_frame
+
+        # Per-stage timings; costs a shared no-op context while disabled
+        self.profiler = FrameProfiler(enabled=profile)
+
+        self.events = EventBus()
+        self.banners = BannerBoard()
+        self.events.subscribe(self.banners.show)
+        if on_event is not None:
+            self.events.subscribe(on_event)
+        if door_actuator is not None:
+            self.events.subscribe(door_actuator, kinds={"access_granted"})
+        self.audit = None
+        if audit_path is not None:
+            self.audit = AuditLog(audit_path, thumbnails=audit_thumbnails)
+            self.events.subscribe(self.audit.record)
+        self.verification_enabled = True
+        self._enrolling = set()  # cameras whose decisions are held back
+
+        # Enrolled templates are loaded once and kept in sync in the background
+        self.gallery = GalleryStore(
+            user_data_dir, embedder_factory=embedder_factory, search_workers=search_workers
+        )
+
+        # All cameras share one batched recogniser over the same gallery
+        self.recognizer = RecognitionEngine(self.gallery)
+
+        self.pipelines = {}
+        self.camera_sources = {}
+        self._gates = {}
+        self._trackers = {}
+        self.schedulers = {}
+        self._next_camera_id = 0
+
+    def start(self):
+        if self.audit is not None:
+            self.audit.start()
+        self.events.start()
+        self.gallery.start_watching()
+        self.recognizer.start()
+
+    def stop(self):
+        for camera_id in list(self.pipelines):
+            self.close_camera(camera_id)
+        self.recognizer.stop()
+        self.gallery.stop()
+        self.events.stop()
+        if self.audit is not None:
+            self.audit.stop()
+
+    def open_camera(self, source, workers=None, capture=None, lossless=False):
+        camera_id = self._next_camera_id
+        self._next_camera_id += 1
+
+        pipeline = FramePipeline(
+            capture if capture is not None else open_capture(source, self.capture_settings),
+            self.make_frame_processor,
+            self.render,
+            self._on_result,
+            workers=workers or self.workers,
+            camera_id=camera_id,
+            profiler=self.profiler,
+            lossless=lossless
+        )
+        self.pipelines[camera_id] = pipeline
+        self.camera_sources[camera_id] = source
+        self._gates[camera_id] = DecisionGate()
+        self._trackers[camera_id] = FaceTracker(self.gallery.threshold)
+        if self.adaptive:
+            self.schedulers[camera_id] = DetectionScheduler()
+        pipeline.start()
+        return camera_id
+
+    def close_camera(self, camera_id):
+        pipeline = self.pipelines.pop(camera_id, None)
+        if pipeline is not None:
+            pipeline.stop()
+        self.camera_sources.pop(camera_id, None)
+        self._gates.pop(camera_id, None)
+        self._trackers.pop(camera_id, None)
+        self.schedulers.pop(camera_id, None)
+
+    def switch_camera(self, camera_id, source, capture=None):
+        self.pipelines[camera_id].switch_capture(
+            capture if capture is not None else open_capture(source, self.capture_settings)
+        )
+        self.camera_sources[camera_id] = source
+        self._trackers[camera_id].reset()
+        if camera_id in self.schedulers:
+            self.schedulers[camera_id].reset()
+
+    def capture_state(self, camera_id):
+        # (state, reconnects) of a camera's capture; plain captures such as
+        # video files always report "streaming"
+        capture = self.pipelines[camera_id].capture
+        if capture is None:
+            return "closed", 0
+        return getattr(capture, "state", "streaming"), getattr(capture, "reconnects", 0)
+
+    def reset_decisions(self):
+        # Forget previous outcomes so whoever is in view is announced again
+        for camera_id in list(self._gates):
+            self._gates[camera_id] = DecisionGate()
+        for tracker in list(self._trackers.values()):
+            tracker.reset()
+
+    def latest_frame(self, camera_id):
+        return self.pipelines[camera_id].latest_frame()
+
+    def enroll_burst(self, camera_id, unique_id, name, duration=2.0, keep=5):
+        # Watches the camera for `duration` seconds and enrols the `keep`
+        # best-quality crops as separate templates. Blocks the caller; returns
+        # the stored crops (best first), empty when no usable face was seen.
+        # The camera makes no access decisions meanwhile, so the person
+        # being enrolled is not reported as unknown.
+        check_record(unique_id, name)
+        burst = BurstEnrollment(
+            FaceDetector(self.detection_settings), FaceNormalizer(), keep=keep
+        )
+        self._enrolling.add(camera_id)
+        try:
+            faces = burst.capture(lambda: self.latest_frame(camera_id), duration)
+            if faces:
+                self._store_enrollment(unique_id, name, faces)
+        finally:
+            self._enrolling.discard(camera_id)
+            if camera_id in self._gates:
+                self._gates[camera_id] = DecisionGate()
+        return faces
+
+    def _store_enrollment(self, unique_id, name, faces):
+        self.gallery.add_user(unique_id, name, faces)
+
+        # The crops are kept next to the gallery file so it can be rebuilt
+        # for another embedder
+        user_folder = os.path.join(self.user_data_dir, f"{unique_id}_{name}")
+        os.makedirs(user_folder, exist_ok=True)
+        for file_name in os.listdir(user_folder):
+            if file_name.startswith('face') and file_name.endswith('.jpg'):
+                os.remove(os.path.join(user_folder, file_name))
+        for n, face in enumerate(faces):
+            file_name = 'face.jpg' if n == 0 else f'face_{n}.jpg'
+            cv2.imwrite(os.path.join(user_folder, file_name), face)
+
+        # Faces in view may have been cached as unknown a moment ago
+        for tracker in list(self._trackers.values()):
+            tracker.invalidate()
+
+    def make_frame_processor(self, camera_id):
+        # Each worker gets its own classifiers; CascadeClassifier is not thread-safe
+        detector = FaceDetector(self.detection_settings)
+        normalizer = FaceNormalizer()
+        embedder = self.gallery.create_embedder()
+        profiler = self.profiler
+        tracker = self._trackers[camera_id]
+        scheduler = self.schedulers.get(camera_id)
+
+        def process(result):
+            if scheduler is not None:
+                with profiler.stage("schedule", camera_id):
+                    detect = scheduler.should_detect(result.frame, time.monotonic())
+                if not detect:
+                    scheduler.carry_over(result, time.monotonic())
+                    return
+
+            with profiler.stage("grayscale", camera_id):
+                gray = cv2.cvtColor(result.frame, cv2.COLOR_BGR2GRAY)
+            with profiler.stage("detect", camera_id):
+                result.faces = detector.detect(gray)
+            if self.verification_enabled and len(result.faces) > 0:
+                # Only new, expired or borderline tracks go to the recogniser
+                now = time.monotonic()
+                tracks = tracker.update(result.faces, now, result.seq)
+                pending = [t for t in tracks if tracker.needs_verification(t, now)]
+                if pending:
+                    with profiler.stage("embed", camera_id):
+                        embeddings = embedder.embed_many(
+                            [normalizer.crop(gray, t.box) for t in pending]
+                        )
+                    with profiler.stage("recognize", camera_id):
+                        try:
+                            identities = self.recognizer.identify(list(embeddings))
+                        except FutureTimeout:
+                            # Recogniser overloaded: the tracks stay pending
+                            # and this frame counts as unverified
+                            identities = None
+                    for track, identity in zip(pending, identities or ()):
+                        tracker.record(track, identity, now)
+                else:
+                    identities = ()
+
+                result.tracks = [t.track_id for t in tracks]
+                result.identities = [t.identity for t in tracks]
+                decisions = [t.decision for t in tracks if t.decision is not None]
+                if decisions and identities is not None:
+                    result.match, result.score = best_identity(decisions)
+                    result.verified = True
+
+            if scheduler is not None:
+                scheduler.update(result, time.monotonic())
+
+        return process
+
+    def _on_result(self, result):
+        gate = None if result.camera_id in self._enrolling else self._gates.get(result.camera_id)
+        event = gate.update(result, time.monotonic()) if gate is not None else None
+        if event is not None:
+            event.source = self.camera_sources.get(result.camera_id)
+            self.events.publish(event)
+        if self.on_frame is not None:
+            self.on_frame(result)
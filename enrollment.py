@@ -0,0 +1,78 @@
+import time
+
+import cv2
+import numpy as np
+
+from recognition import FACE_SIZE, largest_face
+
+
+def face_quality(gray, box, size=FACE_SIZE):
+    # Score in [0, 1] for how good a template this detection makes, from
+    # sharpness (variance of the Laplacian), exposure, face size and a
+    # left/right symmetry check as a cheap frontal-pose proxy
+    x, y, w, h = box
+    face = cv2.resize(gray[y:y + h, x:x + w], size, interpolation=cv2.INTER_AREA)
+
+    sharpness = min(1.0, cv2.Laplacian(face, cv2.CV_64F).var() / 300.0)
+    brightness = 1.0 - abs(float(face.mean()) - 128.0) / 128.0
+    coverage = min(1.0, w / 160.0)
+    half = size[0] // 2
+    left = face[:, :half].astype(np.int16)
+    right = face[:, -half:][:, ::-1].astype(np.int16)
+    pose = 1.0 - float(np.abs(left - right).mean()) / 64.0
+
+    scores = {
+        "sharpness": sharpness,
+        "brightness": brightness,
+        "size": coverage,
+        "pose": max(0.0, pose),
+    }
+    scores["total"] = (
+        0.4 * scores["sharpness"] + 0.2 * scores["brightness"]
+        + 0.2 * scores["size"] + 0.2 * scores["pose"]
+    )
+    return scores
+
+
+class BurstEnrollment:
+    # Collects frames for a couple of seconds, scores the largest face in
+    # each and keeps the best `keep` aligned crops as separate templates.
+    # Frames with several faces are skipped so a passer-by is never
+    # enrolled under someone else's name.
+
+    def __init__(self, detector, normalizer, keep=5, min_quality=0.3):
+        self.detector = detector
+        self.normalizer = normalizer
+        self.keep = keep
+        self.min_quality = min_quality
+        self._candidates = []
+
+    def add_frame(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = self.detector.detect(gray, full=True)
+        if len(faces) != 1:
+            return None
+        box = largest_face(faces)
+        quality = face_quality(gray, box)
+        if quality["total"] >= self.min_quality:
+            self._candidates.append((quality["total"], gray, box))
+        return quality
+
+    def best_crops(self):
+        # Aligned crops of the best frames, best first; only these are
+        # normalised, the rest are never cropped at all
+        best = sorted(self._candidates, key=lambda c: c[0], reverse=True)[:self.keep]
+        return [self.normalizer.crop(gray, box) for _, gray, box in best]
+
+    def capture(self, read_frame, duration=2.0, interval=0.1):
+        # read_frame() returns the newest frame or None; the same frame
+        # object is only scored once
+        deadline = time.monotonic() + duration
+        last = None
+        while time.monotonic() < deadline:
+            frame = read_frame()
+            if frame is not None and frame is not last:
+                last = frame
+                self.add_frame(frame)
+            time.sleep(interval)
+        return self.best_crops()
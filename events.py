@@ -0,0 +1,77 @@
+import logging
+import queue
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class EventBus:
+    # Fans access events out to subscribers (GUI, event log, door actuator,
+    # service sinks) from a dispatcher thread, so a slow subscriber never
+    # holds up recognition or rendering.
+
+    def __init__(self):
+        self._subscribers = []
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def subscribe(self, callback, kinds=None):
+        # kinds: optional collection of event kinds, e.g. {"access_granted"}
+        self._subscribers = self._subscribers + [(callback, kinds)]
+
+    def unsubscribe(self, callback):
+        self._subscribers = [s for s in self._subscribers if s[0] is not callback]
+
+    def publish(self, event):
+        if self._thread is None:
+            self._dispatch(event)
+        else:
+            self._queue.put(event)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="event-bus", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            if event is None:
+                return
+            self._dispatch(event)
+
+    def _dispatch(self, event):
+        for callback, kinds in self._subscribers:
+            if kinds is not None and event.kind not in kinds:
+                continue
+            try:
+                callback(event)
+            except Exception:
+                log.exception("Event subscriber %r failed", callback)
+
+
+class BannerBoard:
+    # Latest decision per camera, drawn over the video for a few seconds
+
+    def __init__(self, duration=3.0):
+        self.duration = duration
+        self._banners = {}
+
+    def show(self, event):
+        self._banners[event.camera_id] = (event, time.monotonic() + self.duration)
+
+    def get(self, camera_id):
+        banner = self._banners.get(camera_id)
+        if banner is None or banner[1] < time.monotonic():
+            return None
+        return banner[0]
@@ -0,0 +1,448 @@
+import argparse
+import hashlib
+import logging
+import os
+import re
+import sys
+import threading
+import zipfile
+
+import cv2
+import numpy as np
+
+from galleryfile import DELETED, GalleryFile, check_record, latest_rows
+from recognition import EmbeddingIndex, FaceNormalizer, LBPEmbedder
+from sharding import ShardedSearch
+
+log = logging.getLogger(__name__)
+
+GALLERY_FILE = "gallery.bin"
+# Trained IVF partitions of the index, kept next to the gallery file
+PARTITIONS_SUFFIX = ".ivf"
+# face.jpg is the best template of a user, face_1.jpg, face_2.jpg... the rest
+_TEMPLATE_FILE = re.compile(r"face(_\d+)?\.jpg$")
+
+
+def split_folder(folder):
+    # user_data/<id>_<name> -> (id, name)
+    return tuple(folder.split('_', 1)) if '_' in folder else ('', folder)
+
+
+def partitions_key(embedder_name, synced, labels):
+    # Identifies the exact index content (file state and row order) a set
+    # of partitions was trained for
+    return hashlib.sha1(repr((embedder_name, synced, labels)).encode()).hexdigest()
+
+
+def write_partitions(path, key, partitions):
+    centroids, lists, trained_size = partitions
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        np.savez(
+            f, key=np.array(key), centroids=centroids,
+            rows=np.concatenate(lists), sizes=np.array([len(rows) for rows in lists]),
+            trained_size=np.array(trained_size)
+        )
+    os.replace(temp_path, path)
+
+
+def read_partitions(path, key):
+    # Partitions saved under key, or None
+    try:
+        with np.load(path) as data:
+            if str(data["key"]) != key:
+                return None
+            bounds = np.concatenate([[0], np.cumsum(data["sizes"])])
+            rows = data["rows"]
+            lists = [rows[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+            return data["centroids"], lists, int(data["trained_size"])
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+
+class GalleryStore:
+    # Keeps an embedding of every enrolled face in memory so verification
+    # never has to hit the disk. The embeddings live in a single gallery
+    # file (see galleryfile.py) that is memory-mapped at startup instead of
+    # decoding one JPEG per user; enrolments are appended to it. A user can
+    # have several templates, indexed as (label, n); a probe's score for
+    # that user is its best template match.
+    #
+    # A background thread picks up entries appended by another process and
+    # imports user_data/<id>_<name>/face.jpg folders the file has never
+    # seen, so the old layout keeps working as a drop-in. Deleting a user's
+    # folder while the store is open revokes them (the watcher appends a
+    # removal), and a folder put back after that is imported again. It also trains the
+    # IVF partitions and saves them next to the file (gallery.bin.ivf), so
+    # a warm start of an unchanged gallery is partitioned immediately.
+    #
+    # embedder_factory builds the recognition backend (LBPEmbedder,
+    # DnnEmbedder, ...); workers call create_embedder() to get their own.
+    # search_workers > 0 scans large galleries in a ShardedSearch process
+    # pool instead of the in-process index.
+
+    def __init__(self, user_data_dir, poll_interval=2.0, embedder_factory=LBPEmbedder,
+                 partitioned=True, gallery_path=None, search_workers=0):
+        self.user_data_dir = user_data_dir
+        self.poll_interval = poll_interval
+        self.embedder_factory = embedder_factory
+
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._normalizer = FaceNormalizer()
+        self._embedder = embedder_factory()
+        self.threshold = self._embedder.threshold
+        self.index = EmbeddingIndex(partitioned=partitioned)
+        self.file = GalleryFile(gallery_path or os.path.join(user_data_dir, GALLERY_FILE))
+        self.partitions_path = self.file.path + PARTITIONS_SUFFIX
+        self._names = {}         # label -> user name
+        self._templates = {}     # label -> number of templates in the index
+        self._seen = set()       # every label with an entry in the file, removed or not
+        self._removed = {}       # label -> time of the removal that is its latest entry
+        self._synced = (None, 0)  # (generation, count) of the file already indexed
+        self._failed = {}        # folder -> mtime of a face.jpg that could not be read
+        self._folders = None     # folders listed by the last scan of user_data
+        self._removals = []      # removal records carried over into a rebuilt file
+        self._saved = (None, None)  # (labels list, key) of the partitions on disk
+
+        self._stop_event = threading.Event()
+        self._watcher = None
+
+        self._pool = None
+        if search_workers > 0:
+            pool = ShardedSearch(search_workers)
+            if pool.start():
+                self._pool = pool
+
+        os.makedirs(self.user_data_dir, exist_ok=True)
+        self._check_file()
+        self.refresh()
+
+    def __len__(self):
+        return len(self._names)
+
+    def create_embedder(self):
+        return self.embedder_factory()
+
+    def identify(self, embeddings):
+        # Best (user_name, score) per embedding, or (None, score) below threshold
+        if len(embeddings) == 0:
+            return []
+        queries = np.stack(embeddings)
+        found = None
+        if self._pool is not None:
+            found = self._pool.search(queries, *self.index.view())
+        keys, scores = found if found is not None else self.index.search(queries)
+        names = self._names
+        return [
+            (names.get(key[0]) if key is not None and score >= self.threshold else None,
+             float(score))
+            for key, score in zip(keys, scores)
+        ]
+
+    def users(self):
+        return sorted(self._names)
+
+    def add_user(self, unique_id, name, faces):
+        # faces: crops already produced by FaceNormalizer.crop(), best first;
+        # they replace whatever templates the user had before
+        check_record(unique_id, name)
+        with self._load_lock:
+            embeddings = self._embedder.embed_many(faces)
+            self._append([(unique_id, name, 0)] * len(faces), embeddings)
+            self._sync_file()
+
+    def remove_user(self, unique_id, name):
+        with self._load_lock:
+            header = self.file.header()
+            if header is None:
+                return
+            self._append([(unique_id, name, DELETED)], np.zeros((1, header["dim"])))
+            self._sync_file()
+
+    def refresh(self):
+        # A header read and a listdir unless something actually changed
+        with self._load_lock:
+            changed = self._sync_file()
+            return self._import_folders() or changed
+
+    def _check_file(self):
+        # Embeddings from a different backend are useless; start over and
+        # let the folder import rebuild them. Removed users keep their
+        # removal, or their folders would bring them back.
+        header = self.file.header()
+        if header is None:
+            return
+        dim = getattr(self._embedder, "dim", None)
+        if header["embedder"] != self._embedder.name[:32] or (dim and header["dim"] != dim):
+            log.warning("%s was built with %s, rebuilding for %s",
+                        self.file.path, header["embedder"], self._embedder.name)
+            _, entries, _ = self.file.read()
+            for label, (rows, name) in latest_rows(entries).items():
+                if name is None:
+                    entry = entries[rows[0]]
+                    self._removals.append((
+                        entry["user_id"].decode("utf-8"), entry["name"].decode("utf-8"), DELETED
+                    ))
+                    self._seen.add(label)
+                    self._removed[label] = float(entry["created"])
+            os.unlink(self.file.path)
+
+    def _append(self, records, vectors):
+        vectors = np.asarray(vectors, np.float32)
+        if self.file.header() is None:
+            self.file.create(vectors.shape[1], self._embedder.name)
+            if self._removals:
+                self.file.append(
+                    self._removals, np.zeros((len(self._removals), vectors.shape[1]))
+                )
+                self._removals = []
+        self.file.append(records, vectors)
+
+    def _sync_file(self):
+        header = self.file.header()
+        if header is None:
+            return False
+        generation, count = self._synced
+        if header["generation"] == generation and header["count"] == count:
+            return False
+
+        if header["generation"] != generation:
+            # New or rewritten file: map it and index it in one go
+            header, entries, matrix = self.file.read()
+            latest = latest_rows(entries)
+            live = sorted(
+                (row, label, n)
+                for label, (rows, name) in latest.items() if name is not None
+                for n, row in enumerate(rows)
+            )
+            rows = [row for row, _, _ in live]
+            # Without superseded entries the mapped matrix is used as is
+            vectors = matrix if len(rows) == len(entries) else matrix[rows]
+            keys = [(label, n) for _, label, n in live]
+            partitions = None
+            if self.index.partitioned and len(keys) >= self.index.partition_min:
+                key = partitions_key(
+                    self._embedder.name, (header["generation"], header["count"]), keys
+                )
+                partitions = read_partitions(self.partitions_path, key)
+            with self._lock:
+                # Partitioning a large gallery takes seconds; unless the
+                # partitions saved last time still apply, the watcher does it
+                # in the background and exact search covers until then
+                self.index.reset(keys, vectors, train=False, partitions=partitions)
+                if partitions is not None:
+                    self._saved = (None, key)
+                self._names = {
+                    label: name for label, (_, name) in latest.items() if name is not None
+                }
+                self._templates = {
+                    label: len(rows) for label, (rows, name) in latest.items()
+                    if name is not None
+                }
+                self._seen = set(latest)
+                self._removed = {
+                    label: float(entries[rows[0]]["created"])
+                    for label, (rows, name) in latest.items() if name is None
+                }
+        else:
+            header, entries, matrix = self.file.read(count)
+            latest = latest_rows(entries, count)
+            with self._lock:
+                names = dict(self._names)
+                templates = dict(self._templates)
+                keys, rows = [], []
+                for label, (new_rows, name) in latest.items():
+                    kept = len(new_rows) if name is not None else 0
+                    # add_many() swaps the overlapping templates atomically;
+                    # only surplus old ones are removed separately
+                    for n in range(kept, templates.pop(label, 0)):
+                        self.index.remove((label, n))
+                    names.pop(label, None)
+                    if name is not None:
+                        names[label] = name
+                        templates[label] = kept
+                        keys += [(label, n) for n in range(kept)]
+                        rows += [row - count for row in new_rows]
+                if keys:
+                    self.index.add_many(keys, matrix[rows])
+                self._names = names
+                self._templates = templates
+                self._seen.update(latest)
+                for label, (new_rows, name) in latest.items():
+                    if name is None:
+                        self._removed[label] = float(entries[new_rows[0] - count]["created"])
+                    else:
+                        self._removed.pop(label, None)
+
+        self._synced = (header["generation"], header["count"])
+        if self._pool is not None:
+            # Here, on the watcher or enrolling thread, so searches never
+            # wait for the workers to map the new gallery
+            self._pool.publish(*self.index.view())
+        return True
+
+    def _import_folders(self):
+        try:
+            folders = os.listdir(self.user_data_dir)
+        except OSError:
+            return False
+
+        records, vectors = self._removed_folders(folders)
+        for folder in sorted(folders):
+            if folder in self._seen and not self._restored(folder):
+                continue
+            face_path = os.path.join(self.user_data_dir, folder, 'face.jpg')
+            try:
+                mtime = os.stat(face_path).st_mtime
+            except OSError:
+                continue
+            if self._failed.get(folder) == mtime:
+                continue
+
+            user_id, name = split_folder(folder)
+            try:
+                check_record(user_id, name)
+            except ValueError as exc:
+                log.warning("Skipping %s: %s", folder, exc)
+                self._failed[folder] = mtime
+                continue
+
+            faces = []
+            folder_path = os.path.join(self.user_data_dir, folder)
+            for file_name in sorted(os.listdir(folder_path)):
+                if not _TEMPLATE_FILE.match(file_name):
+                    continue
+                stored_img = cv2.imread(
+                    os.path.join(folder_path, file_name), cv2.IMREAD_GRAYSCALE
+                )
+                if stored_img is not None:
+                    faces.append(self._normalizer.from_image(stored_img))
+            if not faces:
+                self._failed[folder] = mtime
+                continue
+            records += [(user_id, name, 0)] * len(faces)
+            vectors += list(self._embedder.embed_many(faces))
+
+        if not records:
+            return False
+        self._append(records, vectors)
+        self._sync_file()
+        return True
+
+    def _restored(self, folder):
+        # True for the folder of a removed user that was put back (renamed
+        # or rewritten) after the removal, e.g. after a brief unmount
+        removed_at = self._removed.get(folder)
+        if removed_at is None:
+            return False
+        try:
+            stat = os.stat(os.path.join(self.user_data_dir, folder))
+        except OSError:
+            return False
+        return max(stat.st_mtime, stat.st_ctime) > removed_at
+
+    def _removed_folders(self, folders):
+        # Removal records for enrolled users whose folder was deleted. Only
+        # folders an earlier scan in this process listed count: users
+        # enrolled without a folder, or whose folder is still being written,
+        # are never revoked, and the first scan only takes stock.
+        present = set(folders)
+        known, self._folders = self._folders, present
+        if known is None:
+            return [], []
+        header = self.file.header()
+        if header is None:
+            return [], []
+        records = []
+        for label in sorted(known - present):
+            name = self._names.get(label)
+            if name is None:
+                continue
+            user_id = label[:-len(name) - 1] if label != name else ''
+            log.info("Folder of %s was deleted, revoking the user", label)
+            records.append((user_id, name, DELETED))
+        return records, list(np.zeros((len(records), header["dim"]), np.float32))
+
+    def start_watching(self):
+        if self._watcher is not None:
+            return
+        self._stop_event.clear()
+        self._watcher = threading.Thread(
+            target=self._watch_loop, name="gallery-watcher", daemon=True
+        )
+        self._watcher.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=self.poll_interval + 1)
+            self._watcher = None
+        if self._pool is not None:
+            self._pool.stop()
+
+    def _save_partitions(self):
+        with self._load_lock:
+            partitions = self.index.partitions()
+            labels = self.index.view()[1]
+            synced = self._synced
+        if partitions is None or labels is self._saved[0]:
+            return
+        key = partitions_key(self._embedder.name, synced, labels)
+        if key != self._saved[1]:
+            try:
+                write_partitions(self.partitions_path, key, partitions)
+            except OSError as exc:
+                log.warning("Cannot save %s: %s", self.partitions_path, exc)
+        self._saved = (labels, key)
+
+    def _watch_loop(self):
+        while True:
+            try:
+                self.index.train()
+                self._save_partitions()
+                if self._stop_event.wait(self.poll_interval):
+                    return
+                self.refresh()
+            except Exception:
+                # A half-written file or permission hiccup must not kill
+                # the watcher; the next poll will pick it up
+                continue
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Manage the gallery file.")
+    parser.add_argument("--user-data", default="user_data",
+                        help="directory with enrolled users (default: user_data)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("import", help="add user_data/<id>_<name>/face.jpg folders to the file")
+    sub.add_parser("list", help="print the enrolled users")
+    sub.add_parser("compact", help="drop superseded and removed entries")
+    remove = sub.add_parser("remove", help="remove a user")
+    remove.add_argument("user_id")
+    remove.add_argument("name")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv if argv is not None else sys.argv[1:])
+    if args.command == "compact":
+        gallery_file = GalleryFile(os.path.join(args.user_data, GALLERY_FILE))
+        print(f"dropped {gallery_file.compact()} entries")
+        return 0
+
+    # Opening the store imports any folders the file has not seen yet
+    store = GalleryStore(args.user_data, partitioned=False)
+    if args.command == "import":
+        print(f"{len(store)} users in {store.file.path}")
+    elif args.command == "list":
+        for label in store.users():
+            print(label)
+    elif args.command == "remove":
+        store.remove_user(args.user_id, args.name)
+        print(f"{len(store)} users left")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialised within a process
+    fcntl = None
+
+MAGIC = b"FACEGAL1"
+VERSION = 1
+
+# magic, version, dim, capacity, count, generation, embedder name
+_HEADER = struct.Struct("<8sIIIIQ32s")
+HEADER_SIZE = 128
+_COUNT_OFFSET = 20
+
+DELETED = 1
+
+ENTRY = np.dtype([
+    ("user_id", "S64"),
+    ("name", "S128"),
+    ("flags", "<u4"),
+    ("created", "<f8"),
+])
+
+
+def _encode(value, size, field):
+    data = value.encode("utf-8")
+    if len(data) > size:
+        raise ValueError(f"{field} is longer than {size} bytes: {value!r}")
+    return data
+
+
+def check_record(user_id, name):
+    # Raises ValueError for an id or name that does not fit the table
+    _encode(user_id, 64, "User ID")
+    _encode(name, 128, "Name")
+
+
+def _matrix_offset(capacity):
+    # Embeddings start on a 64-byte boundary after the entry table
+    end = HEADER_SIZE + capacity * ENTRY.itemsize
+    return (end + 63) // 64 * 64
+
+
+class GalleryFile:
+    # The whole gallery in one file: a fixed header, a table of
+    # (user id, name, flags, created) entries and a float32 matrix with one
+    # embedding per entry. Table and matrix are preallocated for `capacity`
+    # entries so appending never moves existing data, and readers map the
+    # matrix with np.memmap instead of decoding anything.
+    #
+    # Entries are only ever appended: enrolling someone again adds newer
+    # entries and removing them adds a DELETED one. The entries written by
+    # one append() share their timestamp; for a user with several templates
+    # that group is one enrolment. The count in the header
+    # is written last, so an interrupted append leaves the file unchanged.
+    # Running out of capacity (or compact()) rewrites the file under a new
+    # generation number, which tells readers to reload from scratch.
+    # Writers in several processes (the app, the gallery CLI) are serialised
+    # with an flock on <path>.lock, which survives the file being replaced.
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.path + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def header(self):
+        # dict of header fields, or None if there is no valid file
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read(_HEADER.size)
+        except OSError:
+            return None
+        if len(data) < _HEADER.size:
+            return None
+        magic, version, dim, capacity, count, generation, embedder = _HEADER.unpack(data)
+        if magic != MAGIC or version != VERSION:
+            return None
+        return {
+            "dim": dim,
+            "capacity": capacity,
+            "count": count,
+            "generation": generation,
+            "embedder": embedder.rstrip(b"\0").decode("utf-8", "replace"),
+        }
+
+    def read(self, start=0):
+        # (header, entries, embeddings) for entries start..count. entries is
+        # a small copy; embeddings is a read-only view of the mapped file.
+        header = self.header()
+        if header is None:
+            return None, np.empty(0, ENTRY), np.empty((0, 0), np.float32)
+        count, capacity, dim = header["count"], header["capacity"], header["dim"]
+        if count <= start:
+            return header, np.empty(0, ENTRY), np.empty((0, dim), np.float32)
+
+        entries = np.fromfile(
+            self.path, ENTRY, count - start, offset=HEADER_SIZE + start * ENTRY.itemsize
+        )
+        matrix = np.memmap(
+            self.path, np.float32, "r", offset=_matrix_offset(capacity),
+            shape=(capacity, dim)
+        )
+        return header, entries, matrix[start:count]
+
+    def create(self, dim, embedder, capacity=1024):
+        # No-op if another writer created the file first
+        with self._locked():
+            if self.header() is not None:
+                return
+            self._write(dim, embedder, np.empty(0, ENTRY),
+                        np.empty((0, dim), np.float32), capacity, 1)
+
+    def append(self, records, vectors):
+        # records: [(user_id, name, flags)], one row of vectors each
+        vectors = np.ascontiguousarray(vectors, np.float32).reshape(len(records), -1)
+        now = time.time()
+        entries = np.array([
+            (_encode(user_id, 64, "User ID"), _encode(name, 128, "Name"), flags, now)
+            for user_id, name, flags in records
+        ], ENTRY)
+
+        with self._locked():
+            header = self.header()
+            if header is None:
+                raise FileNotFoundError(self.path)
+            count, capacity, dim = header["count"], header["capacity"], header["dim"]
+            if vectors.shape[1] != dim:
+                raise ValueError(f"expected {dim}-dim embeddings, got {vectors.shape[1]}")
+
+            if count + len(records) > capacity:
+                _, old_entries, old_matrix = self.read()
+                capacity = max(2 * capacity, 2 * (count + len(records)))
+                self._write(dim, header["embedder"], old_entries, old_matrix,
+                            capacity, header["generation"] + 1)
+
+            with open(self.path, "r+b") as f:
+                f.seek(HEADER_SIZE + count * ENTRY.itemsize)
+                f.write(entries.tobytes())
+                f.seek(_matrix_offset(capacity) + count * dim * 4)
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+                # Commit point
+                f.seek(_COUNT_OFFSET)
+                f.write(struct.pack("<I", count + len(records)))
+                f.flush()
+                os.fsync(f.fileno())
+
+    def compact(self):
+        # Rewrite with only the newest enrolment per user; returns how many
+        # entries were dropped. Removals are kept so the user's folder is
+        # not imported again.
+        with self._locked():
+            header, entries, matrix = self.read()
+            if header is None:
+                return 0
+            rows = np.asarray(sorted(
+                row for rows, _ in latest_rows(entries).values() for row in rows
+            ), np.intp)
+            self._write(header["dim"], header["embedder"], entries[rows], matrix[rows],
+                        max(1024, 2 * len(rows)), header["generation"] + 1)
+            return len(entries) - len(rows)
+
+    def _write(self, dim, embedder, entries, matrix, capacity, generation):
+        # Write a complete file next to the old one and swap it in; readers
+        # that still map the old file keep a valid view
+        tmp_path = self.path + ".tmp"
+        offset = _matrix_offset(capacity)
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(
+                MAGIC, VERSION, dim, capacity, len(entries), generation,
+                embedder.encode("utf-8")[:32]
+            ).ljust(HEADER_SIZE, b"\0"))
+            f.write(entries.tobytes())
+            f.seek(offset)
+            f.write(np.ascontiguousarray(matrix, np.float32).tobytes())
+            f.truncate(offset + capacity * dim * 4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+def entry_label(entry):
+    # Same key as the user_data/<id>_<name> folder of that user
+    user_id = entry["user_id"].decode("utf-8")
+    name = entry["name"].decode("utf-8")
+    return (f"{user_id}_{name}" if user_id else name), name
+
+
+def latest_rows(entries, start=0):
+    # label -> (rows, name) of the newest enrolment per user, or (rows, None)
+    # if the newest entry removed the user. Rows are numbered from start.
+    latest = {}
+    created = {}
+    for offset, entry in enumerate(entries):
+        label, name = entry_label(entry)
+        if entry["flags"] & DELETED:
+            name = None
+        current = latest.get(label)
+        if (current is not None and current[1] is not None and name is not None
+                and created[label] == entry["created"]):
+            current[0].append(start + offset)
+        else:
+            latest[label] = ([start + offset], name)
+            created[label] = entry["created"]
+    return latest
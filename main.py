@@ -1,17 +1,34 @@
-import sys
-import cv2
 import os
+import sys
+import threading
+import math
+import time
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QLabel, QPushButton, QVBoxLayout, QLineEdit,
     QHBoxLayout, QMessageBox, QGroupBox, QScrollArea, QFrame, QSplitter,
-    QStatusBar, QProgressBar, QComboBox
+    QStatusBar, QProgressBar, QComboBox, QSpinBox, QGridLayout, QListWidget,
+    QListWidgetItem
 )
-from PyQt5.QtGui import QImage, QPixmap, QFont, QColor, QPainter, QPen, QIcon
-from PyQt5.QtCore import QTimer, Qt, QSize, QPropertyAnimation, QEasingCurve
+from PyQt5.QtGui import QPixmap, QFont, QColor, QPainter, QPen, QIcon
+from PyQt5.QtCore import (
+    QTimer, Qt, QSize, QPropertyAnimation, QEasingCurve, QObject, QEvent, pyqtSignal
+)
+
+# OpenCV and the engine modules are imported on the startup thread (see
+# load_engine) so the window is up before they have finished loading
+
+
+class PipelineSignals(QObject):
+    # Emitted from the render threads, delivered on the GUI thread
+    frame_ready = pyqtSignal(object)
+    access_event = pyqtSignal(object)
+    enrollment_done = pyqtSignal(object)
+    startup_progress = pyqtSignal(str)
+    engine_ready = pyqtSignal(object)
 
 
 class FaceDetectionApp(QWidget):
-    def __init__(self):
+    def __init__(self, camera_indices=None):
         super().__init__()
 
         # UI setup
@@ -86,8 +103,8 @@ class FaceDetectionApp(QWidget):
         # Status indicator
         self.status_layout = QHBoxLayout()
         self.status_label = QLabel("System Status:")
-        self.status_indicator = QLabel("Ready")
-        self.status_indicator.setStyleSheet("color: #3498db; font-weight: bold;")
+        self.status_indicator = QLabel("Starting...")
+        self.status_indicator.setStyleSheet("color: #f39c12; font-weight: bold;")
         self.status_layout.addWidget(self.status_label)
         self.status_layout.addWidget(self.status_indicator)
         self.status_layout.addStretch()
@@ -97,21 +114,30 @@ class FaceDetectionApp(QWidget):
         self.camera_frame = QFrame()
         self.camera_frame.setFrameStyle(QFrame.StyledPanel | QFrame.Sunken)
         self.camera_frame.setStyleSheet("background-color: #000000; border: 2px solid #3498db; border-radius: 8px;")
-        self.camera_layout = QVBoxLayout(self.camera_frame)
+        self.camera_layout = QGridLayout(self.camera_frame)
         self.camera_layout.setContentsMargins(1, 1, 1, 1)
-        
-        # Face display label
-        self.label = QLabel()
-        self.label.setAlignment(Qt.AlignCenter)
-        self.label.setMinimumSize(640, 480)
-        self.camera_layout.addWidget(self.label)
+        self.camera_layout.setSpacing(2)
         self.left_layout.addWidget(self.camera_frame)
+
+        # One tile (video label + throughput line) and renderer per open camera
+        self.camera_tiles = {}
+        self.renderers = {}
+        self.label_cameras = {}
         
         # Detection status bar
         self.status_bar = QStatusBar()
         self.status_bar.setStyleSheet("background-color: #333333; color: #f0f0f0;")
         self.status_bar.showMessage("No faces detected")
         self.left_layout.addWidget(self.status_bar)
+
+        # Optional per-stage timing panel
+        self.profiler_panel = QLabel()
+        self.profiler_panel.setStyleSheet(
+            "background-color: #252525; color: #95a5a6; font-family: monospace; "
+            "font-size: 11px; padding: 6px;"
+        )
+        self.profiler_panel.setVisible(False)
+        self.left_layout.addWidget(self.profiler_panel)
         
         # Right panel for controls
         self.right_panel = QWidget()
@@ -138,6 +164,27 @@ class FaceDetectionApp(QWidget):
         self.camera_selector.currentIndexChanged.connect(self.change_camera)
         camera_select_layout.addWidget(self.camera_selector)
         camera_layout.addLayout(camera_select_layout)
+
+        # Extra cameras shown side by side in the grid
+        extra_camera_layout = QHBoxLayout()
+        extra_camera_layout.addWidget(QLabel("Add Camera:"))
+        self.extra_camera_index = QSpinBox()
+        self.extra_camera_index.setRange(0, 16)
+        self.extra_camera_index.setValue(1)
+        extra_camera_layout.addWidget(self.extra_camera_index)
+        self.add_camera_button = QPushButton("Add")
+        self.add_camera_button.clicked.connect(self.add_extra_camera)
+        extra_camera_layout.addWidget(self.add_camera_button)
+        self.remove_camera_button = QPushButton("Remove")
+        self.remove_camera_button.clicked.connect(self.remove_extra_camera)
+        extra_camera_layout.addWidget(self.remove_camera_button)
+        camera_layout.addLayout(extra_camera_layout)
+
+        # Per-stage timing overlay
+        self.profiler_button = QPushButton("Show Profiler")
+        self.profiler_button.setCheckable(True)
+        self.profiler_button.toggled.connect(self.toggle_profiler)
+        camera_layout.addWidget(self.profiler_button)
         
         # Detection sensitivity
         sensitivity_layout = QHBoxLayout()
@@ -149,6 +196,24 @@ class FaceDetectionApp(QWidget):
         self.sensitivity_slider.setOrientation(Qt.Horizontal)
         sensitivity_layout.addWidget(self.sensitivity_slider)
         camera_layout.addLayout(sensitivity_layout)
+
+        # Face size limits, shared with every detector; the engine's
+        # settings are filled in once it has loaded
+        self.detection_settings = None
+        face_size_layout = QHBoxLayout()
+        face_size_layout.addWidget(QLabel("Face Size (px):"))
+        self.min_face_size = QSpinBox()
+        self.min_face_size.setRange(0, 2000)
+        self.min_face_size.setPrefix("min ")
+        self.min_face_size.valueChanged.connect(self.change_face_size)
+        face_size_layout.addWidget(self.min_face_size)
+        self.max_face_size = QSpinBox()
+        self.max_face_size.setRange(0, 4000)
+        self.max_face_size.setPrefix("max ")
+        self.max_face_size.setSpecialValueText("max any")
+        self.max_face_size.valueChanged.connect(self.change_face_size)
+        face_size_layout.addWidget(self.max_face_size)
+        camera_layout.addLayout(face_size_layout)
         
         self.camera_group.setLayout(camera_layout)
         self.right_layout.addWidget(self.camera_group)
@@ -260,6 +325,17 @@ class FaceDetectionApp(QWidget):
         self.unlock_group.setLayout(self.unlock_layout)
         self.right_layout.addWidget(self.unlock_group)
 
+        # Access event log (newest first, non-modal)
+        self.event_log_group = QGroupBox("Event Log")
+        event_log_layout = QVBoxLayout()
+        self.event_log = QListWidget()
+        self.event_log.setStyleSheet("background-color: #252525; border: none; font-size: 11px;")
+        self.event_log.setMinimumHeight(120)
+        event_log_layout.addWidget(self.event_log)
+        self.event_log_group.setLayout(event_log_layout)
+        self.right_layout.addWidget(self.event_log_group)
+        self.event_log_limit = 200
+
         # Add spacer
         self.right_layout.addStretch()
         
@@ -268,45 +344,206 @@ class FaceDetectionApp(QWidget):
         self.splitter.addWidget(self.right_panel)
         self.splitter.setSizes([650, 350])
 
-        # OpenCV and QTimer setup
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_frame)
-        self.capture = cv2.VideoCapture(0)
-        self.face_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-        )
-
-        self.is_registering = False
         self.user_data_dir = 'user_data'
-        os.makedirs(self.user_data_dir, exist_ok=True)
 
-        # Variables to track access states
-        self.access_denied_displayed = False
-        self.access_granted_displayed = False
-        self.detected_faces = []  # Store detected faces for drawing
+        # Status indicator falls back to "Ready" a few seconds after a decision
+        self.status_reset_timer = QTimer()
+        self.status_reset_timer.setSingleShot(True)
+        self.status_reset_timer.timeout.connect(self.reset_status)
+
+        # Capture, detection and recognition live in the GUI-independent
+        # engine; results come back through Qt signals
+        self.signals = PipelineSignals()
+        self.signals.frame_ready.connect(self.on_frame_ready)
+        self.signals.access_event.connect(self.on_access_event)
+        self.signals.enrollment_done.connect(self.on_enrollment_done)
+        self.signals.startup_progress.connect(self.status_indicator.setText)
+        self.signals.engine_ready.connect(self.on_engine_ready)
+
+        # Refresh the per-camera throughput lines once cameras are open
+        self.stats_timer = QTimer()
+        self.stats_timer.timeout.connect(self.update_camera_stats)
+
+        # The engine (OpenCV, cascades, gallery, audit log) loads in the
+        # background; the controls that need it stay disabled until then
+        self.engine = None
+        self.camera_indices = camera_indices or [0]
+        self.closed = False
+        for group in (self.camera_group, self.registration_group, self.unlock_group):
+            group.setEnabled(False)
+        threading.Thread(target=self.load_engine, name="startup", daemon=True).start()
 
-        # Start the camera feed
-        self.timer.start(30)
-        
         # Animation for button feedback
         self.animation = QPropertyAnimation(self.takePhotoButton, b"geometry")
         self.animation.setDuration(100)
         
+    def load_engine(self):
+        # Runs on the startup thread; each step is shown in the status indicator
+        progress = self.signals.startup_progress.emit
+        try:
+            progress("Loading OpenCV...")
+            from engine import AccessEvent, FaceEngine
+            import profiling, render  # noqa: F401 - needed on the GUI thread later
+
+            progress("Loading face detector and gallery...")
+            engine = FaceEngine(
+                self.user_data_dir,
+                render=self.render_frame,
+                on_frame=self.signals.frame_ready.emit,
+                on_event=self.signals.access_event.emit,
+                audit_path=os.path.join(self.user_data_dir, 'audit.db')
+            )
+
+            progress("Starting services...")
+            engine.start()
+            # Decisions persisted by earlier sessions, oldest first
+            history = [
+                AccessEvent.from_dict(record)
+                for record in reversed(engine.audit.query(limit=self.event_log_limit))
+            ]
+        except Exception as exc:
+            # Reported on the GUI thread instead of dying with this one
+            self.signals.engine_ready.emit(exc)
+            return
+        self.signals.engine_ready.emit((engine, history))
+
+    def on_engine_ready(self, outcome):
+        if isinstance(outcome, Exception):
+            if not self.closed:
+                self.status_indicator.setText("Startup failed")
+                self.status_indicator.setStyleSheet("color: #e74c3c; font-weight: bold;")
+                QMessageBox.critical(self, "Startup Error", str(outcome))
+            return
+        engine, history = outcome
+        if self.closed:
+            # The window was closed while the engine was still loading
+            engine.stop()
+            return
+
+        self.engine = engine
+        self.detection_settings = engine.detection_settings
+        self.min_face_size.setValue(self.detection_settings.min_face_size)
+        self.max_face_size.setValue(self.detection_settings.max_face_size)
+        for event in history:
+            self.log_event(event)
+
+        # Cameras connect in the background; the first one is the primary camera
+        for index in self.camera_indices:
+            self.open_camera(index)
+        self.primary_camera = min(self.engine.pipelines)
+        self.stats_timer.start(1000)
+
+        for group in (self.camera_group, self.registration_group, self.unlock_group):
+            group.setEnabled(True)
+        self.reset_status()
+
     def change_camera(self, index):
-        self.capture.release()
-        self.capture = cv2.VideoCapture(index)
-        if not self.capture.isOpened():
-            QMessageBox.warning(self, "Camera Error", f"Failed to open camera {index}")
-            self.capture = cv2.VideoCapture(0)  # Fallback to default camera
-            self.camera_selector.setCurrentIndex(0)
+        # The new camera is opened in the background and keeps retrying;
+        # its tile reports the connection state instead of a modal dialog
+        current = self.engine.camera_sources[self.primary_camera]
+        if index == current:
+            return
+        if index in self.engine.camera_sources.values():
+            QMessageBox.warning(self, "Camera Error", f"Camera {index} is already open")
+            self.camera_selector.blockSignals(True)
+            if isinstance(current, int) and current < self.camera_selector.count():
+                self.camera_selector.setCurrentIndex(current)
+            self.camera_selector.blockSignals(False)
+            return
+        self.engine.switch_camera(self.primary_camera, index)
+        self.camera_tiles[self.primary_camera][0].setToolTip(f"Camera {index}")
+
+    def open_camera(self, index, workers=2):
+        from render import FrameRenderer
+
+        tile = QWidget()
+        tile_layout = QVBoxLayout(tile)
+        tile_layout.setContentsMargins(0, 0, 0, 0)
+        video_label = QLabel()
+        video_label.setAlignment(Qt.AlignCenter)
+        video_label.setMinimumSize(320, 240)
+        video_label.setToolTip(f"Camera {index}")
+        stats_label = QLabel(f"Camera {index}: starting...")
+        stats_label.setStyleSheet("color: #95a5a6; font-size: 11px; border: none;")
+        tile_layout.addWidget(video_label, 1)
+        tile_layout.addWidget(stats_label)
+
+        camera_id = self.engine.open_camera(index, workers=workers)
+        self.camera_tiles[camera_id] = (video_label, stats_label, tile)
+        self.renderers[camera_id] = FrameRenderer()
+        self.renderers[camera_id].set_viewport(video_label.width(), video_label.height())
+        self.label_cameras[video_label] = camera_id
+        video_label.installEventFilter(self)
+        self.layout_camera_grid()
+        return camera_id
+
+    def close_camera(self, camera_id):
+        self.engine.close_camera(camera_id)
+        self.renderers.pop(camera_id, None)
+        video_label, _, tile = self.camera_tiles.pop(camera_id)
+        self.label_cameras.pop(video_label, None)
+        self.camera_layout.removeWidget(tile)
+        tile.deleteLater()
+        self.layout_camera_grid()
+
+    def layout_camera_grid(self):
+        columns = max(1, math.ceil(math.sqrt(len(self.camera_tiles))))
+        for _, _, tile in self.camera_tiles.values():
+            self.camera_layout.removeWidget(tile)
+        for position, camera_id in enumerate(sorted(self.camera_tiles)):
+            tile = self.camera_tiles[camera_id][2]
+            self.camera_layout.addWidget(tile, position // columns, position % columns)
+
+    def add_extra_camera(self):
+        index = self.extra_camera_index.value()
+        if index in self.engine.camera_sources.values():
+            QMessageBox.warning(self, "Camera Error", f"Camera {index} is already open")
+            return
+        self.open_camera(index, workers=1)
+
+    def remove_extra_camera(self):
+        extra = [camera_id for camera_id in self.engine.pipelines
+                 if camera_id != self.primary_camera]
+        if extra:
+            self.close_camera(max(extra))
+
+    def update_camera_stats(self):
+        from profiling import collect_metrics, format_table
+
+        for camera_id, pipeline in self.engine.pipelines.items():
+            source = self.engine.camera_sources[camera_id]
+            state, reconnects = self.engine.capture_state(camera_id)
+            if state == "streaming":
+                stats = pipeline.stats
+                text = (f"Camera {source}: {stats.fps():.1f} fps, "
+                        f"{stats.processed} processed, {pipeline.dropped()} dropped")
+                if reconnects:
+                    text += f", {reconnects} reconnects"
+            else:
+                text = f"Camera {source}: {state}..."
+            self.camera_tiles[camera_id][1].setText(text)
+        if self.profiler_panel.isVisible():
+            self.profiler_panel.setText(format_table(collect_metrics(self.engine)))
+
+    def toggle_profiler(self, enabled):
+        self.engine.profiler.reset()
+        self.engine.profiler.enabled = enabled
+        self.profiler_panel.setVisible(enabled)
+        self.profiler_panel.setText("Collecting..." if enabled else "")
+        self.profiler_button.setText("Hide Profiler" if enabled else "Show Profiler")
+
+    def change_face_size(self):
+        if self.detection_settings is None:
+            return
+        self.detection_settings.min_face_size = self.min_face_size.value()
+        self.detection_settings.max_face_size = self.max_face_size.value()
 
     def start_unlock(self):
-        self.is_registering = False
+        self.engine.verification_enabled = True
         self.status_indicator.setText("Verifying...")
         self.status_indicator.setStyleSheet("color: #f39c12; font-weight: bold;")
         self.clear_inputs()
-        self.access_denied_displayed = False  # Reset access denied state
-        self.access_granted_displayed = False  # Reset access granted state
+        self.engine.reset_decisions()  # Announce whoever is in view again
 
     def clear_inputs(self):
         self.nameInput.clear()
@@ -332,38 +569,52 @@ class FaceDetectionApp(QWidget):
         """)
         QTimer.singleShot(200, self.reset_button_style)
 
-        self.status_indicator.setText("Capturing...")
+        self.status_indicator.setText("Capturing... hold still")
         self.status_indicator.setStyleSheet("color: #e74c3c; font-weight: bold;")
+        self.takePhotoButton.setEnabled(False)
+
+        # A ~2 s burst; the best few frames become this user's templates
+        threading.Thread(
+            target=self.run_enrollment, args=(unique_id, name), name="enrollment", daemon=True
+        ).start()
+
+    def run_enrollment(self, unique_id, name):
+        # Runs on the enrollment thread
+        try:
+            result = self.engine.enroll_burst(self.primary_camera, unique_id, name)
+        except Exception as exc:
+            # ValueError for an id or name the gallery cannot hold, OSError
+            # when the crops or the gallery file cannot be written
+            result = exc
+        self.signals.enrollment_done.emit((unique_id, name, result))
+
+    def on_enrollment_done(self, outcome):
+        unique_id, name, result = outcome
+        self.takePhotoButton.setEnabled(True)
+
+        if isinstance(result, Exception):
+            QMessageBox.warning(self, "Registration Error", str(result))
+            self.reset_status()
+            return
 
-        ret, frame = self.capture.read()
-        if ret:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
+        if not result:
+            QMessageBox.warning(self, "Registration Error", "No human face detected. Please position your face in the camera view.")
+            self.reset_status()
+            return
 
-            if len(faces) == 0:
-                QMessageBox.warning(self, "Registration Error", "No human face detected. Please position your face in the camera view.")
-                self.status_indicator.setText("Ready")
-                self.status_indicator.setStyleSheet("color: #3498db; font-weight: bold;")
-                return
+        self.status_indicator.setText("Registered")
+        self.status_indicator.setStyleSheet("color: #2ecc71; font-weight: bold;")
 
-            # Proceed with photo capture
-            user_folder = os.path.join(self.user_data_dir, f"{unique_id}_{name}")
-            os.makedirs(user_folder, exist_ok=True)
-            img_path = os.path.join(user_folder, 'face.jpg')
-            cv2.imwrite(img_path, frame)
-            
-            self.status_indicator.setText("Registered")
-            self.status_indicator.setStyleSheet("color: #2ecc71; font-weight: bold;")
-            
-            msg = QMessageBox()
-            msg.setIcon(QMessageBox.Information)
-            msg.setWindowTitle("Registration Successful")
-            msg.setText(f"User {name} with ID {unique_id} has been registered successfully!")
-            msg.setStandardButtons(QMessageBox.Ok)
-            msg.exec_()
-            
-            # Reset status after delay
-            QTimer.singleShot(2000, self.reset_status)
+        msg = QMessageBox()
+        msg.setIcon(QMessageBox.Information)
+        msg.setWindowTitle("Registration Successful")
+        msg.setText(f"User {name} with ID {unique_id} has been registered successfully "
+                    f"with {len(result)} face templates!")
+        msg.setStandardButtons(QMessageBox.Ok)
+        msg.exec_()
+
+        # Reset status after delay
+        QTimer.singleShot(2000, self.reset_status)
 
     def reset_button_style(self):
         self.takePhotoButton.setStyleSheet("""
@@ -386,131 +637,148 @@ class FaceDetectionApp(QWidget):
         self.status_indicator.setText("Ready")
         self.status_indicator.setStyleSheet("color: #3498db; font-weight: bold;")
 
-    def update_frame(self):
-        ret, frame = self.capture.read()
-        if ret:
-            # Create a copy of the frame for drawing
-            display_frame = frame.copy()
+    def render_frame(self, result):
+        # Runs on the camera's render thread
+        renderer = self.renderers.get(result.camera_id)
+        if renderer is None:
+            return None
+        with self.engine.profiler.stage("draw", result.camera_id):
+            return renderer.render(
+                result.frame, lambda buffer, scale: self.draw_overlays(buffer, scale, result)
+            )
+
+    def draw_overlays(self, display_frame, scale, result):
+        import cv2
+
+        # Draw fancy rectangles around faces (in display coordinates)
+        identities = result.identities or [None] * len(result.faces)
+        tracks = result.tracks or [None] * len(result.faces)
+        for box, identity, track_id in zip(result.faces, identities, tracks):
+            x, y, w, h = (int(v * scale) for v in box)
+
+            # Per-face identity from this frame's batched lookup
+            if identity is None:
+                label, color = "Face Detected", (0, 165, 255)
+            elif identity[0] is None:
+                label, color = f"Unknown ({identity[1]:.2f})", (60, 76, 231)
+            else:
+                label, color = f"{identity[0]} ({identity[1]:.2f})", (113, 204, 46)
+            if track_id is not None:
+                label = f"#{track_id} {label}"
+
+            # Main rectangle
+            cv2.rectangle(display_frame, (x, y), (x + w, y + h), color, 2)
+            
+            # Corner markers (top-left)
+            cv2.line(display_frame, (x, y), (x + 20, y), (0, 255, 0), 3)
+            cv2.line(display_frame, (x, y), (x, y + 20), (0, 255, 0), 3)
+            
+            # Corner markers (top-right)
+            cv2.line(display_frame, (x + w, y), (x + w - 20, y), (0, 255, 0), 3)
+            cv2.line(display_frame, (x + w, y), (x + w, y + 20), (0, 255, 0), 3)
             
-            # Face detection
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
+            # Corner markers (bottom-left)
+            cv2.line(display_frame, (x, y + h), (x + 20, y + h), (0, 255, 0), 3)
+            cv2.line(display_frame, (x, y + h), (x, y + h - 20), (0, 255, 0), 3)
             
-            # Store detected faces for drawing
-            self.detected_faces = faces
+            # Corner markers (bottom-right)
+            cv2.line(display_frame, (x + w, y + h), (x + w - 20, y + h), (0, 255, 0), 3)
+            cv2.line(display_frame, (x + w, y + h), (x + w, y + h - 20), (0, 255, 0), 3)
             
+            # Add face ID label
+            cv2.rectangle(display_frame, (x, y - 30), (x + w, y), color, -1)
+            cv2.putText(display_frame, label, (x + 5, y - 10),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+
+        # Banner for the latest access decision on this camera
+        banner = self.engine.banners.get(result.camera_id)
+        if banner is not None:
+            if banner.granted:
+                text, color = f"ACCESS GRANTED - {banner.user_name}", (113, 204, 46)
+            else:
+                text, color = "ACCESS DENIED", (60, 76, 231)
+            cv2.rectangle(display_frame, (0, 0), (display_frame.shape[1], 50), color, -1)
+            cv2.putText(display_frame, text, (15, 35),
+                       cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2)
+
+    def on_frame_ready(self, result):
+        rendered = result.image
+        try:
+            # Frames can still arrive from a camera that was just closed
+            if result.camera_id not in self.camera_tiles:
+                return
+            label = self.camera_tiles[result.camera_id][0]
+
             # Update status bar with face count
-            face_count = len(faces)
+            face_count = len(result.faces)
+            camera = f"Camera {self.engine.camera_sources.get(result.camera_id)}: "
             if face_count == 0:
-                self.status_bar.showMessage("No faces detected")
+                self.status_bar.showMessage(camera + "No faces detected")
             elif face_count == 1:
-                self.status_bar.showMessage("1 face detected")
+                self.status_bar.showMessage(camera + "1 face detected")
             else:
-                self.status_bar.showMessage(f"{face_count} faces detected")
-            
-            # Draw fancy rectangles around faces
-            for (x, y, w, h) in faces:
-                # Main rectangle
-                cv2.rectangle(display_frame, (x, y), (x + w, y + h), (0, 165, 255), 2)
-                
-                # Corner markers (top-left)
-                cv2.line(display_frame, (x, y), (x + 20, y), (0, 255, 0), 3)
-                cv2.line(display_frame, (x, y), (x, y + 20), (0, 255, 0), 3)
-                
-                # Corner markers (top-right)
-                cv2.line(display_frame, (x + w, y), (x + w - 20, y), (0, 255, 0), 3)
-                cv2.line(display_frame, (x + w, y), (x + w, y + 20), (0, 255, 0), 3)
-                
-                # Corner markers (bottom-left)
-                cv2.line(display_frame, (x, y + h), (x + 20, y + h), (0, 255, 0), 3)
-                cv2.line(display_frame, (x, y + h), (x, y + h - 20), (0, 255, 0), 3)
-                
-                # Corner markers (bottom-right)
-                cv2.line(display_frame, (x + w, y + h), (x + w - 20, y + h), (0, 255, 0), 3)
-                cv2.line(display_frame, (x + w, y + h), (x + w, y + h - 20), (0, 255, 0), 3)
-                
-                # Add face ID label
-                cv2.rectangle(display_frame, (x, y - 30), (x + w, y), (0, 165, 255), -1)
-                cv2.putText(display_frame, "Face Detected", (x + 5, y - 10),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-
-            if not self.is_registering and face_count > 0:
-                self.verify_face(frame)
-
-            # Convert to QImage and display
-            rgb_image = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-            h, w, ch = rgb_image.shape
-            bytes_per_line = ch * w
-            qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            scaled_pixmap = QPixmap.fromImage(qt_image).scaled(
-                self.label.width(), self.label.height(),
-                Qt.KeepAspectRatio, Qt.SmoothTransformation
-            )
-            self.label.setPixmap(scaled_pixmap)
-
-    def verify_face(self, frame):
-        user_folders = os.listdir(self.user_data_dir)
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        face_found = False
-
-        for folder in user_folders:
-            face_path = os.path.join(self.user_data_dir, folder, 'face.jpg')
-            if not os.path.exists(face_path):
-                continue
-                
-            stored_img = cv2.imread(face_path, cv2.IMREAD_GRAYSCALE)
-            if stored_img is not None:
-                # Simple template matching (in a real application, use a more robust method)
-                res = cv2.matchTemplate(gray, stored_img, cv2.TM_CCOEFF_NORMED)
-                threshold = 0.5  # Lowered threshold for demo purposes
-                loc = (res >= threshold).any()
-                
-                if loc:
-                    if not self.access_granted_displayed:
-                        user_name = folder.split('_', 1)[1] if '_' in folder else folder
-                        
-                        self.status_indicator.setText("Access Granted")
-                        self.status_indicator.setStyleSheet("color: #2ecc71; font-weight: bold;")
-                        
-                        msg = QMessageBox()
-                        msg.setIcon(QMessageBox.Information)
-                        msg.setWindowTitle("Access Granted")
-                        msg.setText(f"Welcome {user_name}!\nDoor unlocked.")
-                        msg.setStandardButtons(QMessageBox.Ok)
-                        msg.exec_()
-                        
-                        self.access_granted_displayed = True
-                        
-                        # Reset status after delay
-                        QTimer.singleShot(3000, self.reset_status)
-                    
-                    face_found = True
-                    break
-
-        if not face_found and not self.access_denied_displayed:
+                self.status_bar.showMessage(camera + f"{face_count} faces detected")
+
+            # Already at label size; fromImage is the only copy on this thread
+            if rendered is not None:
+                with self.engine.profiler.stage("display", result.camera_id):
+                    label.setPixmap(QPixmap.fromImage(rendered.image))
+        finally:
+            if rendered is not None:
+                rendered.release()
+
+    def eventFilter(self, obj, event):
+        # Keep each renderer's target size in step with its label
+        if event.type() == QEvent.Resize and obj in self.label_cameras:
+            renderer = self.renderers.get(self.label_cameras[obj])
+            if renderer is not None:
+                renderer.set_viewport(obj.width(), obj.height())
+        return super().eventFilter(obj, event)
+
+    def on_access_event(self, event):
+        self.verify_face(event)
+        self.log_event(event)
+
+    def verify_face(self, event):
+        # Non-blocking: the video keeps running while the decision is shown
+        if event.granted:
+            self.status_indicator.setText(f"Access Granted: {event.user_name}")
+            self.status_indicator.setStyleSheet("color: #2ecc71; font-weight: bold;")
+        else:
             self.status_indicator.setText("Access Denied")
             self.status_indicator.setStyleSheet("color: #e74c3c; font-weight: bold;")
-            
-            msg = QMessageBox()
-            msg.setIcon(QMessageBox.Warning)
-            msg.setWindowTitle("Access Denied")
-            msg.setText("Unrecognized face detected.\nPlease register or try again.")
-            msg.setStandardButtons(QMessageBox.Ok)
-            msg.exec_()
-            
-            self.access_denied_displayed = True
-            
-            # Reset status after delay
-            QTimer.singleShot(3000, self.reset_status)
+
+        # Reset status after delay
+        self.status_reset_timer.start(3000)
+
+    def log_event(self, event):
+        stamp = time.strftime("%H:%M:%S", time.localtime(event.timestamp))
+        # Events persisted before sources were recorded only have the id
+        camera = event.source if event.source is not None else event.camera_id
+        if event.granted:
+            text = f"{stamp}  Camera {camera}  Granted  {event.user_name} ({event.score:.2f})"
+            color = QColor("#2ecc71")
+        else:
+            text = f"{stamp}  Camera {camera}  Denied  unrecognized face"
+            color = QColor("#e74c3c")
+        item = QListWidgetItem(text)
+        item.setForeground(color)
+        self.event_log.insertItem(0, item)
+        while self.event_log.count() > self.event_log_limit:
+            self.event_log.takeItem(self.event_log.count() - 1)
 
     def closeEvent(self, event):
-        self.capture.release()
-        cv2.destroyAllWindows()
+        self.closed = True
+        self.stats_timer.stop()
+        if self.engine is not None:
+            self.engine.stop()
         event.accept()
 
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
-    window = FaceDetectionApp()
+    # Optional camera indices, e.g. "python main.py 0 1 2" for three entrances
+    camera_indices = [int(arg) for arg in sys.argv[1:] if arg.isdigit()]
+    window = FaceDetectionApp(camera_indices)
     window.show()
     sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,236 @@
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+from profiling import FrameProfiler
+
+log = logging.getLogger(__name__)
+
+
+class LatestQueue:
+    # Bounded hand-off between stages. When full, the oldest item is dropped
+    # so a slow consumer always gets the freshest frame instead of a backlog.
+    # With lossless=True put() waits for room instead (offline replays).
+
+    def __init__(self, maxsize=1, lossless=False):
+        self.maxsize = maxsize
+        self.lossless = lossless
+        self.dropped = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item):
+        with self._cond:
+            if self.lossless:
+                while len(self._items) >= self.maxsize and not self._closed:
+                    self._cond.wait(0.1)
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        # Returns None on timeout or once the queue has been closed
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if self._items:
+                item = self._items.popleft()
+                if self.lossless:
+                    self._cond.notify_all()
+                return item
+            return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class PipelineStats:
+    # Throughput counters for one camera pipeline
+
+    def __init__(self, window=2.0):
+        self.window = window
+        self.captured = 0
+        self.processed = 0
+        self.rendered = 0
+        self.stale = 0          # finished out of order and never shown
+        self.failed = 0         # raised while being processed or rendered
+        self._render_times = deque()
+
+    def mark_rendered(self, now):
+        self.rendered += 1
+        self._render_times.append(now)
+        while self._render_times and now - self._render_times[0] > self.window:
+            self._render_times.popleft()
+
+    def fps(self):
+        times = self._render_times
+        if len(times) < 2:
+            return 0.0
+        span = time.monotonic() - times[0]
+        return (len(times) - 1) / span if span > 0 else 0.0
+
+
+class FrameResult:
+    __slots__ = ("camera_id", "seq", "timestamp", "frame", "faces", "match",
+                 "score", "identities", "tracks", "verified", "image")
+
+    def __init__(self, camera_id, seq, timestamp, frame):
+        self.camera_id = camera_id
+        self.seq = seq
+        self.timestamp = timestamp
+        self.frame = frame
+        self.faces = ()
+        self.match = None       # user name of the recognised face, if any
+        self.score = None       # best similarity seen for this frame
+        self.identities = ()    # (user name or None, score) for each face
+        self.tracks = ()        # tracker ID for each face (None if untracked)
+        self.verified = False   # True when a face in view has a settled decision
+        self.image = None       # output of the render stage
+
+
+class FramePipeline:
+    # capture thread -> detection/recognition workers -> render thread
+    #
+    # process_factory(camera_id) is called once per worker and must return a
+    # callable that fills in a FrameResult; this lets every worker own its own
+    # (non thread-safe) cascade classifier. render(result) runs on the render
+    # thread (skipped when None, e.g. headless) and on_result(result)
+    # receives the finished frame.
+
+    def __init__(self, capture, process_factory, render, on_result,
+                 workers=2, queue_size=1, camera_id=0, profiler=None,
+                 lossless=False):
+        self.camera_id = camera_id
+        self.stats = PipelineStats()
+        self.profiler = profiler or FrameProfiler()
+        self.process_factory = process_factory
+        self.render = render
+        self.on_result = on_result
+        self.workers = max(1, workers)
+
+        self.lossless = lossless
+        self.frame_queue = LatestQueue(queue_size, lossless)
+        self.result_queue = LatestQueue(queue_size, lossless)
+
+        self._capture = capture
+        self._capture_lock = threading.Lock()
+        self._latest_frame = None
+        self._seq = itertools.count()
+        self._last_rendered = -1
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop_event.clear()
+        self._threads.append(threading.Thread(
+            target=self._capture_loop, name=f"capture-{self.camera_id}", daemon=True
+        ))
+        for i in range(self.workers):
+            self._threads.append(threading.Thread(
+                target=self._worker_loop, name=f"detect-{self.camera_id}-{i}", daemon=True
+            ))
+        self._threads.append(threading.Thread(
+            target=self._render_loop, name=f"render-{self.camera_id}", daemon=True
+        ))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self.frame_queue.close()
+        self.result_queue.close()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+        with self._capture_lock:
+            old, self._capture = self._capture, None
+        if old is not None:
+            old.release()
+
+    def switch_capture(self, capture):
+        # Returns at once; the old capture is released in the background
+        # since that can block (a grab thread stuck opening its device)
+        with self._capture_lock:
+            old, self._capture = self._capture, capture
+            self._latest_frame = None
+        if old is not None:
+            threading.Thread(
+                target=old.release, name=f"release-{self.camera_id}", daemon=True
+            ).start()
+
+    @property
+    def capture(self):
+        return self._capture
+
+    def latest_frame(self):
+        return self._latest_frame
+
+    def dropped(self):
+        return (self.frame_queue.dropped + self.result_queue.dropped
+                + self.stats.stale + self.stats.failed)
+
+    def _capture_loop(self):
+        profiler = self.profiler
+        while not self._stop_event.is_set():
+            with self._capture_lock, profiler.stage("capture", self.camera_id):
+                capture = self._capture
+                ret, frame = capture.read() if capture is not None else (False, None)
+            if not ret:
+                # Camera not ready or being switched; avoid spinning
+                time.sleep(0.01)
+                continue
+            self._latest_frame = frame
+            self.stats.captured += 1
+            self.frame_queue.put(
+                FrameResult(self.camera_id, next(self._seq), time.monotonic(), frame)
+            )
+
+    def _worker_loop(self):
+        process = self.process_factory(self.camera_id)
+        while not self._stop_event.is_set():
+            result = self.frame_queue.get(timeout=0.1)
+            if result is None:
+                continue
+            try:
+                process(result)
+            except Exception:
+                # One bad frame must not stop the camera
+                log.exception("Processing frame %d of camera %s failed", result.seq, self.camera_id)
+                self.stats.failed += 1
+                continue
+            self.stats.processed += 1
+            self.result_queue.put(result)
+
+    def _render_loop(self):
+        while not self._stop_event.is_set():
+            result = self.result_queue.get(timeout=0.1)
+            if result is None:
+                continue
+            # Workers can finish out of order; never show an older frame
+            # (lossless replays still deliver it)
+            if result.seq <= self._last_rendered and not self.lossless:
+                self.stats.stale += 1
+                continue
+            self._last_rendered = max(self._last_rendered, result.seq)
+            try:
+                if self.render is not None:
+                    result.image = self.render(result)
+                now = time.monotonic()
+                self.stats.mark_rendered(now)
+                self.profiler.record("latency", now - result.timestamp, self.camera_id)
+                self.on_result(result)
+            except Exception:
+                log.exception("Rendering frame %d of camera %s failed", result.seq, self.camera_id)
+                self.stats.failed += 1
@@ -0,0 +1,242 @@
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class _NullTimer:
+    # Shared no-op context manager handed out while profiling is disabled
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _StageTimer:
+    __slots__ = ("profiler", "key", "start")
+
+    def __init__(self, profiler, key):
+        self.profiler = profiler
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._add(self.key, time.perf_counter() - self.start)
+        return False
+
+
+class FrameProfiler:
+    # Rolling per-camera, per-stage latency samples. While disabled, stage()
+    # returns a shared no-op object and record() returns immediately, so the
+    # instrumentation can stay in the hot path.
+
+    def __init__(self, enabled=False, window=1000):
+        self.enabled = enabled
+        self.window = window
+        self._samples = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name, camera_id=None):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, (camera_id, name))
+
+    def record(self, name, seconds, camera_id=None):
+        if self.enabled:
+            self._add((camera_id, name), seconds)
+
+    def reset(self):
+        with self._lock:
+            self._samples = {}
+            self._counts = {}
+
+    def summary(self):
+        # [(camera_id, stage, count, p50, p95, p99)] with latencies in seconds
+        with self._lock:
+            samples = {key: list(values) for key, values in self._samples.items()}
+            counts = dict(self._counts)
+        rows = []
+        for (camera_id, stage), values in sorted(samples.items(), key=_sort_key):
+            p50, p95, p99 = np.percentile(values, (50, 95, 99))
+            rows.append((camera_id, stage, counts[(camera_id, stage)], p50, p95, p99))
+        return rows
+
+    def _add(self, key, seconds):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+                self._counts[key] = 0
+            samples.append(seconds)
+            self._counts[key] += 1
+
+
+def _sort_key(item):
+    camera_id, stage = item[0]
+    return (-1 if camera_id is None else camera_id, stage)
+
+
+def collect_metrics(engine):
+    # Flat snapshot of pipeline counters and stage latencies for one engine
+    cameras = []
+    for camera_id, pipeline in sorted(engine.pipelines.items()):
+        stats = pipeline.stats
+        scheduler = engine.schedulers.get(camera_id)
+        state, reconnects = engine.capture_state(camera_id)
+        cameras.append({
+            "camera": camera_id,
+            "fps": stats.fps(),
+            "captured": stats.captured,
+            "processed": stats.processed,
+            "rendered": stats.rendered,
+            "dropped": pipeline.dropped(),
+            "skipped": scheduler.skipped if scheduler is not None else 0,
+            "detect_interval": scheduler.min_interval if scheduler is not None else 0.0,
+            "frame_queue": len(pipeline.frame_queue),
+            "result_queue": len(pipeline.result_queue),
+            "capture_state": state,
+            "reconnects": reconnects,
+        })
+    return {
+        "timestamp": time.time(),
+        "cameras": cameras,
+        "stages": engine.profiler.summary(),
+        "recognition_batches": engine.recognizer.batches,
+        "recognition_queries": engine.recognizer.queries,
+        "recognition_timeouts": engine.recognizer.timeouts,
+    }
+
+
+def format_table(metrics):
+    # Plain-text view used by the GUI panel
+    lines = []
+    for camera in metrics["cameras"]:
+        lines.append(
+            f"cam {camera['camera']}: {camera['fps']:5.1f} fps  "
+            f"dropped {camera['dropped']}  skipped {camera['skipped']}  "
+            f"queues {camera['frame_queue']}/{camera['result_queue']}"
+            + ("" if camera["capture_state"] == "streaming" else f"  {camera['capture_state']}")
+        )
+    if metrics["stages"]:
+        lines.append(f"{'stage':<18}{'p50':>8}{'p95':>8}{'p99':>8}  ms")
+    for camera_id, stage, _, p50, p95, p99 in metrics["stages"]:
+        name = stage if camera_id is None else f"{camera_id}:{stage}"
+        lines.append(f"{name:<18}{p50 * 1e3:8.2f}{p95 * 1e3:8.2f}{p99 * 1e3:8.2f}")
+    return "\n".join(lines)
+
+
+def to_prometheus(metrics):
+    lines = [
+        "# HELP face_pipeline_fps Rendered frames per second.",
+        "# TYPE face_pipeline_fps gauge",
+    ]
+    for camera in metrics["cameras"]:
+        lines.append(f'face_pipeline_fps{{camera="{camera["camera"]}"}} {camera["fps"]:.3f}')
+
+    lines += [
+        "# HELP face_pipeline_frames_total Frames seen by each pipeline stage.",
+        "# TYPE face_pipeline_frames_total counter",
+    ]
+    for camera in metrics["cameras"]:
+        for kind in ("captured", "processed", "rendered", "dropped", "skipped"):
+            lines.append(
+                f'face_pipeline_frames_total{{camera="{camera["camera"]}",kind="{kind}"}} '
+                f'{camera[kind]}'
+            )
+
+    lines += [
+        "# HELP face_detect_min_interval_seconds Detection throttle under CPU pressure.",
+        "# TYPE face_detect_min_interval_seconds gauge",
+    ]
+    for camera in metrics["cameras"]:
+        lines.append(
+            f'face_detect_min_interval_seconds{{camera="{camera["camera"]}"}} '
+            f'{camera["detect_interval"]:.3f}'
+        )
+
+    lines += [
+        "# HELP face_camera_reconnects_total Times a camera was reopened after dropping out.",
+        "# TYPE face_camera_reconnects_total counter",
+    ]
+    for camera in metrics["cameras"]:
+        lines.append(
+            f'face_camera_reconnects_total{{camera="{camera["camera"]}"}} {camera["reconnects"]}'
+        )
+
+    lines += [
+        "# HELP face_pipeline_queue_depth Items waiting between stages.",
+        "# TYPE face_pipeline_queue_depth gauge",
+    ]
+    for camera in metrics["cameras"]:
+        for queue in ("frame_queue", "result_queue"):
+            lines.append(
+                f'face_pipeline_queue_depth{{camera="{camera["camera"]}",queue="{queue}"}} '
+                f'{camera[queue]}'
+            )
+
+    lines += [
+        "# HELP face_stage_latency_seconds Per-stage latency over the rolling window.",
+        "# TYPE face_stage_latency_seconds summary",
+    ]
+    for camera_id, stage, count, p50, p95, p99 in metrics["stages"]:
+        labels = f'stage="{stage}"' + ("" if camera_id is None else f',camera="{camera_id}"')
+        for quantile, value in (("0.5", p50), ("0.95", p95), ("0.99", p99)):
+            lines.append(f'face_stage_latency_seconds{{{labels},quantile="{quantile}"}} {value:.6f}')
+        lines.append(f"face_stage_latency_seconds_count{{{labels}}} {count}")
+
+    lines += [
+        "# TYPE face_recognition_batches_total counter",
+        f"face_recognition_batches_total {metrics['recognition_batches']}",
+        "# TYPE face_recognition_queries_total counter",
+        f"face_recognition_queries_total {metrics['recognition_queries']}",
+        "# TYPE face_recognition_timeouts_total counter",
+        f"face_recognition_timeouts_total {metrics['recognition_timeouts']}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def to_csv_rows(metrics):
+    # Long format: timestamp,camera,metric,value
+    stamp = f"{metrics['timestamp']:.3f}"
+    rows = []
+    for camera in metrics["cameras"]:
+        for key, value in camera.items():
+            if key != "camera":
+                rows.append((stamp, camera["camera"], key, value))
+    for camera_id, stage, count, p50, p95, p99 in metrics["stages"]:
+        camera = "" if camera_id is None else camera_id
+        rows.append((stamp, camera, f"{stage}_count", count))
+        rows.append((stamp, camera, f"{stage}_p50_ms", round(p50 * 1e3, 3)))
+        rows.append((stamp, camera, f"{stage}_p95_ms", round(p95 * 1e3, 3)))
+        rows.append((stamp, camera, f"{stage}_p99_ms", round(p99 * 1e3, 3)))
+    return rows
+
+
+def export_metrics(metrics, path):
+    # .csv appends rows; anything else is rewritten atomically as a
+    # Prometheus textfile (node_exporter textfile collector friendly)
+    if path.endswith(".csv"):
+        new_file = not os.path.exists(path)
+        with open(path, "a") as f:
+            if new_file:
+                f.write("timestamp,camera,metric,value\n")
+            for row in to_csv_rows(metrics):
+                f.write(",".join(str(v) for v in row) + "\n")
+        return
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(to_prometheus(metrics))
+    os.replace(tmp_path, path)
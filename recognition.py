@@ -0,0 +1,376 @@
+import math
+import os
+import threading
+
+import cv2
+import numpy as np
+
+# Every enrolled template and every probe is brought to this size
+FACE_SIZE = (100, 100)
+
+
+def largest_face(faces):
+    return max(faces, key=lambda f: f[2] * f[3])
+
+
+class FaceNormalizer:
+    # Turns a detection box into an aligned, fixed-size, histogram-equalised
+    # grayscale crop. Holds its own cascades, so use one instance per thread.
+
+    def __init__(self, size=FACE_SIZE, align=True):
+        self.size = size
+        self.face_cascade = cv2.CascadeClassifier(
+            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        )
+        self.eye_cascade = None
+        if align:
+            self.eye_cascade = cv2.CascadeClassifier(
+                cv2.data.haarcascades + 'haarcascade_eye.xml'
+            )
+
+    def crop(self, gray, box):
+        x, y, w, h = box
+        face = gray[y:y + h, x:x + w]
+        if self.eye_cascade is not None:
+            face = self._align(face)
+        face = cv2.resize(face, self.size, interpolation=cv2.INTER_AREA)
+        return cv2.equalizeHist(face)
+
+    def from_image(self, image):
+        # Accepts stored face crops as well as legacy full-frame enrolments
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if image.shape[1::-1] == self.size:
+            return cv2.equalizeHist(image)
+
+        faces = self.face_cascade.detectMultiScale(image, 1.3, 5)
+        if len(faces) > 0:
+            return self.crop(image, largest_face(faces))
+
+        # No face found in an old enrolment photo; keep the user matchable
+        face = cv2.resize(image, self.size, interpolation=cv2.INTER_AREA)
+        return cv2.equalizeHist(face)
+
+    def _align(self, face):
+        # Rotate the face so the eyes are level; leave it alone if the eyes
+        # can't be found reliably
+        h, w = face.shape
+        eyes = self.eye_cascade.detectMultiScale(
+            face[:h // 2], 1.1, 5, minSize=(max(1, w // 8), max(1, w // 8))
+        )
+        if len(eyes) < 2:
+            return face
+
+        eyes = sorted(eyes, key=lambda e: e[2] * e[3], reverse=True)[:2]
+        (x1, y1, w1, h1), (x2, y2, w2, h2) = sorted(eyes, key=lambda e: e[0])
+        dx = (x2 + w2 / 2) - (x1 + w1 / 2)
+        dy = (y2 + h2 / 2) - (y1 + h1 / 2)
+        angle = math.degrees(math.atan2(dy, dx))
+        if abs(angle) > 20:
+            return face
+
+        rotation = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+        return cv2.warpAffine(face, rotation, (w, h), borderMode=cv2.BORDER_REPLICATE)
+
+
+def _uniform_lbp_table():
+    # Maps the 256 LBP codes onto 58 "uniform" patterns plus one catch-all bin
+    table = np.full(256, 58, np.uint8)
+    label = 0
+    for code in range(256):
+        bits = [(code >> i) & 1 for i in range(8)]
+        if sum(bits[i] != bits[(i + 1) % 8] for i in range(8)) <= 2:
+            table[code] = label
+            label += 1
+    return table
+
+
+_UNIFORM_LBP = _uniform_lbp_table()
+_LBP_NEIGHBOURS = ((-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1))
+
+
+class LBPEmbedder:
+    # Uniform LBP histograms over a grid of cells, square-rooted and
+    # L2-normalised so that a dot product is a Hellinger/cosine similarity
+
+    bins = 59
+
+    def __init__(self, size=FACE_SIZE, grid=(7, 7), threshold=0.85):
+        self.size = size
+        self.grid = grid
+        self.threshold = threshold  # Tuned for the demo, raise for stricter matching
+        self.dim = grid[0] * grid[1] * self.bins
+        self.name = f"lbp-{grid[0]}x{grid[1]}-{size[0]}x{size[1]}"
+
+        # Cell index of every interior pixel, so the histogram is one bincount
+        h, w = size[1] - 2, size[0] - 2
+        rows = np.minimum(np.arange(h) * grid[0] // h, grid[0] - 1)
+        cols = np.minimum(np.arange(w) * grid[1] // w, grid[1] - 1)
+        self._cell_offset = ((rows[:, None] * grid[1] + cols[None, :]) * self.bins).ravel()
+
+    def embed(self, face):
+        return self.embed_many([face])[0]
+
+    def embed_many(self, faces):
+        # All faces of a frame in one vectorised pass -> (n, dim) matrix
+        faces = np.stack([
+            face if face.shape[1::-1] == self.size
+            else cv2.resize(face, self.size, interpolation=cv2.INTER_AREA)
+            for face in faces
+        ])
+        center = faces[:, 1:-1, 1:-1]
+        n, h, w = center.shape
+        codes = np.zeros((n, h, w), np.uint8)
+        for bit, (dy, dx) in enumerate(_LBP_NEIGHBOURS):
+            neighbour = faces[:, 1 + dy:1 + dy + h, 1 + dx:1 + dx + w]
+            codes |= (neighbour >= center).astype(np.uint8) << bit
+
+        bins = (
+            np.arange(n)[:, None] * self.dim
+            + self._cell_offset[None, :]
+            + _UNIFORM_LBP[codes].reshape(n, -1)
+        )
+        hist = np.bincount(bins.ravel(), minlength=n * self.dim)
+        hist = np.sqrt(hist.reshape(n, self.dim).astype(np.float32))
+        return hist / (np.linalg.norm(hist, axis=1, keepdims=True) + 1e-12)
+
+
+class DnnEmbedder:
+    # CPU face embedding through cv2.dnn (e.g. an ONNX SFace/ArcFace model).
+    # The network is not thread-safe, so create one per thread.
+
+    def __init__(self, model_path, input_size=(112, 112), scale=1.0 / 255,
+                 mean=(0, 0, 0), swap_rb=True, threshold=0.36):
+        self.net = cv2.dnn.readNet(model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.input_size = input_size
+        self.scale = scale
+        self.mean = mean
+        self.swap_rb = swap_rb
+        self.threshold = threshold
+        self.dim = None  # Known after the first forward pass
+        self.name = "dnn-" + os.path.splitext(os.path.basename(model_path))[0]
+
+    def embed(self, face):
+        return self.embed_many([face])[0]
+
+    def embed_many(self, faces):
+        # One forward pass for every face in the frame
+        faces = [
+            cv2.cvtColor(face, cv2.COLOR_GRAY2BGR) if face.ndim == 2 else face
+            for face in faces
+        ]
+        blob = cv2.dnn.blobFromImages(
+            faces, self.scale, self.input_size, self.mean, self.swap_rb
+        )
+        self.net.setInput(blob)
+        vectors = self.net.forward().reshape(len(faces), -1).astype(np.float32)
+        self.dim = vectors.shape[1]
+        return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+
+
+class EmbeddingIndex:
+    # All enrolled embeddings live in one contiguous float32 matrix and a
+    # batch of queries is answered with a single matrix product. Above
+    # partition_min entries an IVF-style coarse quantiser (k-means centroids)
+    # is trained so only the n_probe closest partitions are scanned.
+    #
+    # Writers take a lock; readers use the immutable view published after
+    # every change, so search() never blocks on enrolment.
+
+    def __init__(self, dim=None, partitioned=True, n_probe=4, partition_min=2048):
+        self.dim = dim
+        self.partitioned = partitioned
+        self.n_probe = n_probe
+        self.partition_min = partition_min
+
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._size = 0
+        self._labels = []
+        self._rows = {}
+        self._centroids = None
+        self._lists = None
+        self._trained_size = 0
+        self._view = (None, [], None, None)
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, label):
+        return label in self._rows
+
+    def labels(self):
+        return list(self._view[1])
+
+    def view(self):
+        # (matrix, labels) as currently published. Neither is modified in
+        # place; every change publishes a new labels list.
+        return self._view[0], self._view[1]
+
+    def add(self, label, vector):
+        self.add_many([label], [vector])
+
+    def add_many(self, labels, vectors):
+        # Bulk insert; the partitions are retrained at most once per call
+        vectors = np.asarray(vectors, np.float32).reshape(len(labels), -1)
+        with self._lock:
+            for label in labels:
+                if label in self._rows:
+                    self._remove_locked(label)
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+
+            needed = self._size + len(labels)
+            if self._matrix is None or needed > len(self._matrix):
+                # Grow geometrically; rows already published stay untouched
+                capacity = max(64, 2 * needed)
+                grown = np.empty((capacity, self.dim), np.float32)
+                if self._size:
+                    grown[:self._size] = self._matrix[:self._size]
+                self._matrix = grown
+
+            start = self._size
+            self._matrix[start:needed] = vectors
+            self._labels = self._labels + list(labels)
+            for offset, label in enumerate(labels):
+                self._rows[label] = start + offset
+            self._size = needed
+
+            if self._centroids is not None:
+                parts = (vectors @ self._centroids.T).argmax(axis=1)
+                lists = list(self._lists)
+                for offset, part in enumerate(parts):
+                    lists[part] = np.append(lists[part], start + offset)
+                self._lists = lists
+
+            self._maybe_train_locked()
+            self._publish_locked()
+
+    def reset(self, labels, vectors, train=True, partitions=None):
+        # Replace everything at once. vectors is used as given, e.g. a
+        # read-only memmap; the next add or remove works on a copy. With
+        # train=False the partitions are left to a later train() call.
+        # partitions, as returned by partitions() for the same labels and
+        # vectors, are adopted instead of training.
+        with self._lock:
+            self._labels = list(labels)
+            self._rows = {label: i for i, label in enumerate(self._labels)}
+            self._size = len(self._labels)
+            if self._size:
+                self._matrix = np.asarray(vectors, np.float32).reshape(self._size, -1)
+                self.dim = self._matrix.shape[1]
+            else:
+                self._matrix = None
+            self._centroids = None
+            self._lists = None
+            self._trained_size = 0
+            if partitions is not None and self.partitioned:
+                centroids, lists, trained_size = partitions
+                if (centroids.shape[1] == self.dim
+                        and sum(len(rows) for rows in lists) == self._size):
+                    self._centroids, self._lists = centroids, list(lists)
+                    self._trained_size = trained_size
+            if train:
+                self._maybe_train_locked()
+            self._publish_locked()
+
+    def partitions(self):
+        # (centroids, lists, trained_size) of the current partitioning, or
+        # None while the index is searched exhaustively
+        with self._lock:
+            if self._centroids is None:
+                return None
+            return self._centroids, self._lists, self._trained_size
+
+    def train(self):
+        # Build the partitions if the index has grown enough to need them
+        with self._lock:
+            self._maybe_train_locked()
+            self._publish_locked()
+
+    def remove(self, label):
+        with self._lock:
+            if label not in self._rows:
+                return False
+            self._remove_locked(label)
+            self._publish_locked()
+            return True
+
+    def search(self, queries):
+        # Returns (labels, scores) of the best entry for every query row
+        queries = np.atleast_2d(np.asarray(queries, np.float32))
+        matrix, labels, centroids, lists = self._view
+        if not labels:
+            return [None] * len(queries), np.full(len(queries), -1.0, np.float32)
+
+        if centroids is None:
+            rows = None
+            candidates = matrix
+        else:
+            coarse = queries @ centroids.T
+            n_probe = min(self.n_probe, len(centroids))
+            probe = np.unique(np.argpartition(-coarse, n_probe - 1, axis=1)[:, :n_probe])
+            rows = np.concatenate([lists[p] for p in probe])
+            candidates = matrix[rows]
+            if rows.size == 0:
+                rows = None
+                candidates = matrix
+
+        scores = queries @ candidates.T
+        best = scores.argmax(axis=1)
+        best_scores = scores[np.arange(len(queries)), best]
+        if rows is not None:
+            best = rows[best]
+        return [labels[i] for i in best], best_scores
+
+    def _remove_locked(self, label):
+        row = self._rows.pop(label)
+        keep = self._size - 1
+        # Copy instead of compacting in place so published views stay valid
+        matrix = np.empty((max(64, keep), self.dim), np.float32)
+        matrix[:row] = self._matrix[:row]
+        matrix[row:keep] = self._matrix[row + 1:self._size]
+        self._matrix = matrix
+        self._size = keep
+        self._labels = self._labels[:row] + self._labels[row + 1:]
+        self._rows = {name: i for i, name in enumerate(self._labels)}
+        if self._centroids is not None:
+            if self._size < self.partition_min:
+                self._centroids = None
+                self._lists = None
+                self._trained_size = 0
+            else:
+                self._assign_locked()
+
+    def _maybe_train_locked(self):
+        if not self.partitioned or self._size < self.partition_min:
+            return
+        if self._size < 2 * self._trained_size:
+            return
+
+        n_lists = max(2, int(math.sqrt(self._size)))
+        data = self._matrix[:self._size]
+        if len(data) > 64 * n_lists:
+            sample = np.random.default_rng(0).choice(len(data), 64 * n_lists, replace=False)
+            data = data[sample]
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1e-3)
+        _, _, centroids = cv2.kmeans(
+            np.ascontiguousarray(data), n_lists, None, criteria, 1, cv2.KMEANS_PP_CENTERS
+        )
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        self._centroids = (centroids / np.maximum(norms, 1e-12)).astype(np.float32)
+        self._trained_size = self._size
+        self._assign_locked()
+
+    def _assign_locked(self):
+        parts = (self._matrix[:self._size] @ self._centroids.T).argmax(axis=1)
+        order = np.argsort(parts, kind="stable")
+        bounds = np.searchsorted(parts[order], np.arange(len(self._centroids) + 1))
+        self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self._centroids))]
+
+    def _publish_locked(self):
+        self._view = (
+            self._matrix[:self._size], self._labels, self._centroids, self._lists
+        )
@@ -0,0 +1,97 @@
+import threading
+
+import cv2
+import numpy as np
+
+# Motion is measured on a small grayscale thumbnail: nearest-neighbour
+# sampling is nearly free, the area step then averages out sensor noise
+_SAMPLE_SIZE = (128, 96)
+MOTION_SIZE = (64, 48)
+
+
+class DetectionScheduler:
+    # Decides, per frame of one camera, whether the cascade runs at all.
+    #
+    # idle   - nobody seen for active_hold seconds: the frame is compared
+    #          with the one last detected on and detection only runs when
+    #          more than motion_threshold of the thumbnail changed by
+    #          pixel_delta grey levels, or every idle_interval seconds as a
+    #          heartbeat.
+    # active - a face was seen recently: every frame is detected.
+    #
+    # Independently of the mode, when frames take longer than
+    # latency_budget from capture to result the minimum gap between
+    # detections grows (x1.5, up to max_interval) and shrinks again once
+    # the workers keep up, so an overloaded machine sheds detection work
+    # instead of queueing it. Skipped frames keep the last boxes so the
+    # overlay does not flicker.
+
+    def __init__(self, motion_threshold=0.01, pixel_delta=16, idle_interval=1.0,
+                 active_hold=2.0, latency_budget=0.15, max_interval=0.5):
+        self.motion_threshold = motion_threshold
+        self.pixel_delta = pixel_delta
+        self.idle_interval = idle_interval
+        self.active_hold = active_hold
+        self.latency_budget = latency_budget
+        self.max_interval = max_interval
+
+        self.min_interval = 0.0
+        self.detected = 0
+        self.skipped = 0
+        self._reference = None
+        self._last_detect = None
+        self._last_face = None
+        self._last = ((), (), ())   # faces, identities, tracks of the last detection
+        self._lock = threading.Lock()
+
+    def _active(self, now):
+        return self._last_face is not None and now - self._last_face < self.active_hold
+
+    def should_detect(self, frame, now):
+        sample = cv2.resize(frame, _SAMPLE_SIZE, interpolation=cv2.INTER_NEAREST)
+        thumb = cv2.cvtColor(
+            cv2.resize(sample, MOTION_SIZE, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY
+        )
+        with self._lock:
+            since = None if self._last_detect is None else now - self._last_detect
+            if since is not None and since < self.min_interval:
+                self.skipped += 1
+                return False
+            if since is not None and not self._active(now) and since < self.idle_interval:
+                changed = cv2.absdiff(thumb, self._reference) > self.pixel_delta
+                if np.count_nonzero(changed) < self.motion_threshold * changed.size:
+                    self.skipped += 1
+                    return False
+            self._reference = thumb
+            self._last_detect = now
+            self.detected += 1
+            return True
+
+    def update(self, result, now):
+        # Called with every detected frame once processing has finished
+        with self._lock:
+            if len(result.faces) > 0:
+                self._last_face = now
+            self._last = (result.faces, result.identities, result.tracks)
+
+            if now - result.timestamp > self.latency_budget:
+                self.min_interval = min(self.max_interval, max(0.02, self.min_interval * 1.5))
+            elif self.min_interval:
+                self.min_interval *= 0.8
+                if self.min_interval < 0.01:
+                    self.min_interval = 0.0
+
+    def carry_over(self, result, now):
+        # Skipped frame: reuse the boxes of the last detection while someone
+        # is in view; the frame does not count as verified
+        with self._lock:
+            if self._active(now):
+                result.faces, result.identities, result.tracks = self._last
+
+    def reset(self):
+        with self._lock:
+            self._reference = None
+            self._last_detect = None
+            self._last_face = None
+            self._last = ((), (), ())
+            self.min_interval = 0.0
@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+
+from capture import CaptureSettings
+from detection import DetectionSettings
+from engine import FaceEngine
+from profiling import collect_metrics, export_metrics
+
+
+class JsonLinesSink:
+    # Writes one JSON object per line; safe to call from several threads
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            self.stream.write(line)
+            self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class SocketSink:
+    # Local Unix socket; every connected client gets the JSON lines stream.
+    # Clients that disconnect or stall are dropped rather than blocking
+    # the event bus.
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            os.unlink(path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(path)
+        self._server.listen()
+        self._clients = []
+        self._lock = threading.Lock()
+        self._accepter = threading.Thread(
+            target=self._accept_loop, name="event-socket", daemon=True
+        )
+        self._accepter.start()
+
+    def __call__(self, record):
+        data = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+        with self._lock:
+            for client in list(self._clients):
+                try:
+                    client.sendall(data)
+                except OSError:
+                    self._clients.remove(client)
+                    client.close()
+
+    def close(self):
+        self._server.close()
+        with self._lock:
+            for client in self._clients:
+                client.close()
+            self._clients = []
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _accept_loop(self):
+        while True:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return
+            client.settimeout(1.0)
+            with self._lock:
+                self._clients.append(client)
+
+
+class CommandActuator:
+    # Door actuator hook: runs a shell command for every granted event with
+    # the decision in FACE_USER / FACE_SOURCE / FACE_SCORE. FACE_SOURCE is
+    # the camera index or URL, which identifies the door; FACE_CAMERA is the
+    # engine's internal camera id. The command is started, not waited on, so
+    # a slow relay never delays other events.
+
+    def __init__(self, command):
+        self.command = command
+        self._running = []
+
+    def __call__(self, event):
+        self._running = [p for p in self._running if p.poll() is None]
+        env = dict(os.environ)
+        env.update(
+            FACE_USER=event.user_name or "",
+            FACE_CAMERA=str(event.camera_id),
+            FACE_SOURCE="" if event.source is None else str(event.source),
+            FACE_SCORE="" if event.score is None else f"{event.score:.4f}",
+        )
+        self._running.append(subprocess.Popen(self.command, shell=True, env=env))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Headless face recognition access service (no GUI)."
+    )
+    parser.add_argument("--camera", action="append", default=[],
+                        help="camera index or video path/URL; repeat for several doors")
+    parser.add_argument("--user-data", default="user_data",
+                        help="directory with enrolled users (default: user_data)")
+    parser.add_argument("--socket", help="also publish events on this Unix socket path")
+    parser.add_argument("--audit", metavar="PATH",
+                        help="audit log of every decision (default: <user-data>/audit.db; "
+                             ".jsonl for rotating JSON lines)")
+    parser.add_argument("--no-audit", action="store_true", help="do not persist decisions")
+    parser.add_argument("--no-thumbnails", action="store_true",
+                        help="leave face thumbnails out of the audit log")
+    parser.add_argument("--on-grant", metavar="CMD",
+                        help="shell command run (not awaited) for every granted access")
+    parser.add_argument("--quiet", action="store_true",
+                        help="do not write events to stdout")
+    parser.add_argument("--workers", type=int, default=2,
+                        help="detection workers per camera (default: 2)")
+    parser.add_argument("--detection-width", type=int, default=640,
+                        help="width frames are downscaled to for detection")
+    parser.add_argument("--metrics-file", metavar="PATH",
+                        help="enable profiling and write metrics here (.csv appends, "
+                             "anything else is a Prometheus textfile)")
+    parser.add_argument("--metrics-interval", type=float, default=10.0,
+                        help="seconds between metrics exports (default: 10)")
+    parser.add_argument("--search-workers", type=int, default=0,
+                        help="processes that share large gallery scans (default: 0, in-process)")
+    parser.add_argument("--no-adaptive", action="store_true",
+                        help="run detection on every frame instead of gating idle scenes")
+    parser.add_argument("--width", type=int, default=640,
+                        help="camera capture width (default: 640)")
+    parser.add_argument("--height", type=int, default=480,
+                        help="camera capture height (default: 480)")
+    parser.add_argument("--fps", type=int, default=30,
+                        help="camera capture frame rate (default: 30)")
+    parser.add_argument("--fourcc", default="MJPG",
+                        help="camera pixel format (default: MJPG; empty for the driver default)")
+    parser.add_argument("--min-face-size", type=int, default=40)
+    parser.add_argument("--max-face-size", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def camera_source(value):
+    return int(value) if value.isdigit() else value
+
+
+def main(argv=None):
+    args = parse_args(argv if argv is not None else sys.argv[1:])
+
+    sinks = []
+    if not args.quiet:
+        sinks.append(JsonLinesSink(sys.stdout))
+    if args.socket:
+        sinks.append(SocketSink(args.socket))
+
+    def emit(record):
+        for sink in sinks:
+            sink(record)
+
+    settings = DetectionSettings(
+        detection_width=args.detection_width,
+        min_face_size=args.min_face_size,
+        max_face_size=args.max_face_size
+    )
+    engine = FaceEngine(
+        args.user_data,
+        detection_settings=settings,
+        workers=args.workers,
+        on_event=lambda event: emit(event.to_dict()),
+        door_actuator=CommandActuator(args.on_grant) if args.on_grant else None,
+        profile=bool(args.metrics_file),
+        adaptive=not args.no_adaptive,
+        search_workers=args.search_workers,
+        audit_path=None if args.no_audit else (
+            args.audit or os.path.join(args.user_data, "audit.db")
+        ),
+        audit_thumbnails=not args.no_thumbnails,
+        capture_settings=CaptureSettings(args.width, args.height, args.fps, args.fourcc)
+    )
+    engine.start()
+
+    for value in (args.camera or ["0"]):
+        camera_id = engine.open_camera(camera_source(value))
+        emit({"event": "camera_opened", "camera": camera_id, "source": value})
+    emit({"event": "ready", "users": len(engine.gallery)})
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    if args.metrics_file:
+        while not stop_event.wait(args.metrics_interval):
+            export_metrics(collect_metrics(engine), args.metrics_file)
+        export_metrics(collect_metrics(engine), args.metrics_file)
+    else:
+        stop_event.wait()
+
+    engine.stop()
+    emit({"event": "stopped"})
+    for sink in sinks:
+        sink.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
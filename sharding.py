@@ -0,0 +1,220 @@
+import logging
+import multiprocessing
+import os
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# The pool is the parallelism; one BLAS thread per worker avoids oversubscription
+_WORKER_ENV = {"OMP_NUM_THREADS": "1", "OPENBLAS_NUM_THREADS": "1", "MKL_NUM_THREADS": "1"}
+
+
+def _shard_bounds(rows, shard, shards):
+    return rows * shard // shards, rows * (shard + 1) // shards
+
+
+def _shard_worker(conn, shard, shards):
+    # Runs in a worker process: keeps a view of its slice of the gallery
+    # block and answers searches with the best (row, score) per query
+    gallery_block = query_block = None
+    matrix = None
+    start = 0
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        kind, name, shape = message
+
+        if kind == "load":
+            matrix = None
+            if gallery_block is not None:
+                gallery_block.close()
+            gallery_block = shared_memory.SharedMemory(name=name)
+            full = np.ndarray(shape, np.float32, buffer=gallery_block.buf)
+            start, end = _shard_bounds(shape[0], shard, shards)
+            matrix = full[start:end]
+            conn.send(True)
+
+        elif kind == "search":
+            if query_block is None or query_block.name != name:
+                if query_block is not None:
+                    query_block.close()
+                query_block = shared_memory.SharedMemory(name=name)
+            queries = np.ndarray(shape, np.float32, buffer=query_block.buf)
+            if matrix is None or len(matrix) == 0:
+                conn.send(None)
+                continue
+            scores = queries @ matrix.T
+            best = scores.argmax(axis=1)
+            conn.send((best + start, scores[np.arange(len(queries)), best]))
+
+    matrix = None
+    for block in (gallery_block, query_block):
+        if block is not None:
+            block.close()
+
+
+class ShardedSearch:
+    # Exact gallery search spread over a pool of worker processes, each
+    # scanning a contiguous slice of the embeddings. The gallery matrix and
+    # every batch of queries travel through multiprocessing.shared_memory,
+    # so only block names and shapes go over the pipes; each worker answers
+    # with the best row and score of its slice and the best of those wins.
+    #
+    # The owner publish()es the gallery whenever it changes, off the search
+    # path. Galleries smaller than min_rows are cheaper to scan in-process;
+    # while a publish is in progress, or when the pool holds an older
+    # gallery, search() returns None and the caller falls back to its
+    # in-process index. Anything going wrong (no shared memory, a worker
+    # dying or timing out) shuts the pool down with the same result.
+    #
+    # timeout (per search) must stay below the caller's own deadline so the
+    # fallback still has time to answer.
+
+    def __init__(self, workers, min_rows=4096, timeout=1.0, load_timeout=10.0):
+        self.workers = workers
+        self.min_rows = min_rows
+        self.timeout = timeout
+        self.load_timeout = load_timeout
+        self._processes = []
+        self._conns = []
+        self._labels = None
+        self._gallery_block = None
+        self._query_block = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        # True when the pool is running
+        context = multiprocessing.get_context("spawn")
+        saved = {key: os.environ.get(key) for key in _WORKER_ENV}
+        try:
+            os.environ.update(_WORKER_ENV)
+            for shard in range(self.workers):
+                parent_conn, child_conn = context.Pipe()
+                process = context.Process(
+                    target=_shard_worker, args=(child_conn, shard, self.workers),
+                    name=f"gallery-shard-{shard}", daemon=True
+                )
+                process.start()
+                child_conn.close()
+                self._processes.append(process)
+                self._conns.append(parent_conn)
+        except (OSError, ValueError) as exc:
+            log.warning("Cannot start search workers (%s); searching in-process", exc)
+            self.stop()
+            return False
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+        return True
+
+    def stop(self):
+        with self._lock:
+            self._shutdown()
+
+    def publish(self, matrix, labels):
+        # Hand the workers a new gallery; blocks until they have mapped it.
+        # labels must be replaced, not mutated, whenever matrix changes.
+        if matrix is None or len(matrix) < self.min_rows:
+            return
+        with self._lock:
+            if not self._conns or labels is self._labels:
+                return
+            try:
+                self._load(matrix)
+                self._labels = labels
+            except (OSError, EOFError, TimeoutError) as exc:
+                log.warning("Search workers failed (%s); searching in-process", exc)
+                self._shutdown()
+
+    def search(self, queries, matrix, labels):
+        # (labels, scores) like EmbeddingIndex.search(), or None to fall back
+        if matrix is None or len(matrix) < self.min_rows:
+            return None
+        queries = np.ascontiguousarray(queries, np.float32)
+        if not self._lock.acquire(blocking=False):
+            return None  # a publish is in progress
+        try:
+            if not self._conns or labels is not self._labels:
+                return None
+            try:
+                block = self._queries_block(queries.nbytes)
+                np.ndarray(queries.shape, np.float32, buffer=block.buf)[:] = queries
+                for conn in self._conns:
+                    conn.send(("search", block.name, queries.shape))
+                results = [self._receive(conn, self.timeout) for conn in self._conns]
+            except (OSError, EOFError, TimeoutError) as exc:
+                log.warning("Search workers failed (%s); searching in-process", exc)
+                self._shutdown()
+                return None
+        finally:
+            self._lock.release()
+
+        results = [r for r in results if r is not None]
+        rows = np.stack([r[0] for r in results])
+        scores = np.stack([r[1] for r in results])
+        shard = scores.argmax(axis=0)
+        columns = np.arange(len(queries))
+        best_rows = rows[shard, columns]
+        return [labels[i] for i in best_rows], scores[shard, columns]
+
+    def _load(self, matrix):
+        # Publish a new gallery block, then drop the old one once every
+        # worker has switched over
+        block = shared_memory.SharedMemory(create=True, size=max(1, matrix.nbytes))
+        np.ndarray(matrix.shape, np.float32, buffer=block.buf)[:] = matrix
+        try:
+            for conn in self._conns:
+                conn.send(("load", block.name, matrix.shape))
+            for conn in self._conns:
+                self._receive(conn, self.load_timeout)
+        finally:
+            old, self._gallery_block = self._gallery_block, block
+            if old is not None:
+                old.close()
+                old.unlink()
+
+    def _queries_block(self, size):
+        if self._query_block is None or self._query_block.size < size:
+            if self._query_block is not None:
+                self._query_block.close()
+                self._query_block.unlink()
+            # Room for a few batches of this size before growing again
+            self._query_block = shared_memory.SharedMemory(create=True, size=4 * size)
+        return self._query_block
+
+    def _receive(self, conn, timeout):
+        if not conn.poll(timeout):
+            raise TimeoutError("search worker did not answer")
+        return conn.recv()
+
+    def _shutdown(self):
+        for conn in self._conns:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for process in self._processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        for conn in self._conns:
+            conn.close()
+        self._processes = []
+        self._conns = []
+        self._labels = None
+        for block in (self._gallery_block, self._query_block):
+            if block is not None:
+                block.close()
+                block.unlink()
+        self._gallery_block = None
+        self._query_block = None
@@ -0,0 +1,126 @@
+import itertools
+import threading
+from collections import Counter, deque
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    w = min(ax + aw, bx + bw) - max(ax, bx)
+    h = min(ay + ah, by + bh) - max(ay, by)
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    return inter / float(aw * ah + bw * bh - inter)
+
+
+class Track:
+    # One face followed across frames. identity is the latest lookup,
+    # decision the outcome of the vote over the last few lookups.
+
+    __slots__ = ("track_id", "box", "last_seen", "identity", "verified_at",
+                 "votes", "decision")
+
+    def __init__(self, track_id, box, now, votes):
+        self.track_id = track_id
+        self.box = box
+        self.last_seen = now
+        self.identity = None     # (user name or None, score)
+        self.verified_at = None  # monotonic time of the last lookup
+        self.votes = deque(maxlen=votes)
+        self.decision = None     # (user name or None, score) once settled
+
+
+class FaceTracker:
+    # Keeps stable IDs for the faces of one camera by matching each frame's
+    # boxes to the previous ones (greedy IoU). A track is looked up against
+    # the gallery only while its vote is still filling, when its cached
+    # identity is older than ttl, or when the last score was within
+    # low_confidence of the threshold; otherwise the cached identity is
+    # reused. The decision changes only when `votes` lookups agree by
+    # majority, so one bad frame cannot flip a grant into a deny.
+    #
+    # Several workers share one tracker; frames that arrive out of order
+    # are matched against the tracks but never move or create them.
+
+    def __init__(self, threshold, ttl=2.0, votes=3, low_confidence=0.03,
+                 iou_threshold=0.3, max_age=0.5):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.votes = votes
+        self.low_confidence = low_confidence
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self._tracks = []
+        self._last_seq = -1
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def update(self, boxes, now, seq):
+        # Track for every box, in the same order
+        with self._lock:
+            current = seq >= self._last_seq
+            if current:
+                self._last_seq = seq
+                self._tracks = [t for t in self._tracks if now - t.last_seen <= self.max_age]
+
+            pairs = sorted(
+                ((iou(box, track.box), i, j)
+                 for i, box in enumerate(boxes)
+                 for j, track in enumerate(self._tracks)),
+                reverse=True
+            )
+            assigned = [None] * len(boxes)
+            used = set()
+            for overlap, i, j in pairs:
+                if overlap < self.iou_threshold:
+                    break
+                if assigned[i] is not None or j in used:
+                    continue
+                assigned[i] = self._tracks[j]
+                used.add(j)
+
+            for i, box in enumerate(boxes):
+                track = assigned[i]
+                if track is None:
+                    # Stale frames get a throwaway track that never decides
+                    track_id = next(self._ids) if current else None
+                    track = assigned[i] = Track(track_id, box, now, self.votes)
+                    if current:
+                        self._tracks.append(track)
+                elif current:
+                    track.box = box
+                    track.last_seen = now
+            return assigned
+
+    def needs_verification(self, track, now):
+        if track.verified_at is None or len(track.votes) < self.votes:
+            return True
+        if now - track.verified_at >= self.ttl:
+            return True
+        return abs(track.identity[1] - self.threshold) < self.low_confidence
+
+    def record(self, track, identity, now):
+        with self._lock:
+            track.identity = identity
+            track.verified_at = now
+            track.votes.append(identity)
+            if len(track.votes) < self.votes:
+                return
+            name, count = Counter(n for n, _ in track.votes).most_common(1)[0]
+            if count * 2 > len(track.votes):
+                score = next(s for n, s in reversed(track.votes) if n == name)
+                track.decision = (name, score)
+
+    def invalidate(self):
+        # Force a fresh lookup for every track, e.g. after the gallery changed
+        with self._lock:
+            for track in self._tracks:
+                track.verified_at = None
+
+    def reset(self):
+        with self._lock:
+            self._tracks = []